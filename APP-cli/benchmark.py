@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Benchmark the rendering and export pipelines on synthetic corpora.
+
+Corpora have the shape of Data/*.jsonl ({id, text, label} records, one file
+per classifier) and are generated from a seed, so every run measures the same
+input. Each scenario varies the document length, the share of labelled words
+and the number of classifiers. Results are written as JSON and can be
+compared against a stored baseline:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --baseline baseline.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import importlib
+import contextlib
+import itertools
+import PIL
+import texty_layout
+from record_stream import iter_records
+from span_search import build_search_index
+from texty_layout import text_words, find_best_font_size, layout_lines, draw_png, draw_mini, save_png, write_svg
+
+CONFIG_PATH = "config.json"
+FLASK_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "APP-flask")
+
+# Default scenario grid
+DOCUMENTS = 20
+LENGTHS = "100,1000"
+DENSITIES = "0.1,0.3"
+CLASSIFIERS = "2"
+
+# Stages timed for every scenario, in pipeline order
+RENDER_STAGES = ("parse", "font_fit", "wrap", "rasterize", "png_encode", "thumbnail", "svg")
+EXPORT_STAGES = ("export_load", "alignment", "stats", "agreement", "search_index")
+FLASK_STAGES = ("texty_gen",)
+
+# Changes smaller than this many seconds are treated as noise when comparing
+NOISE_SECONDS = 0.005
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark the Texty rendering and export pipelines on synthetic corpora.")
+    parser.add_argument('--documents', type=int, default=DOCUMENTS, help=f"Documents per classifier file in each scenario (default: {DOCUMENTS})")
+    parser.add_argument('--lengths', default=LENGTHS, help=f"Comma separated document lengths in words (default: {LENGTHS})")
+    parser.add_argument('--densities', default=DENSITIES, help=f"Comma separated shares of labelled words (default: {DENSITIES})")
+    parser.add_argument('--classifiers', default=CLASSIFIERS, help=f"Comma separated numbers of classifier files (default: {CLASSIFIERS})")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per scenario; the fastest run of each stage is kept (default: 3)")
+    parser.add_argument('--seed', type=int, default=1, help="Seed of the synthetic corpora (default: 1)")
+    parser.add_argument('--stages', default="render,export,flask", help="Comma separated stage groups to run: render, export, flask (default: all)")
+    parser.add_argument('--output', default="benchmark-results.json", help="Where to write the results (default: benchmark-results.json)")
+    parser.add_argument('--baseline', help="Results file of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Slowdown over the baseline reported as a regression (default: 0.2 = 20%%)")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated corpora and outputs (their folder is printed)")
+    return parser.parse_args()
+
+def load_categories(config_path):
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    return {entry["category"]: entry["color"] for entry in config["categories"]}
+
+# -----------------------------
+# Synthetic corpora
+# -----------------------------
+def make_vocabulary(rng, size=2000):
+    """Pseudo words of varying length, with a few non-ASCII letters like the real data."""
+    syllables = ["ka", "lo", "mi", "ne", "st", "ra", "vi", "är", "ön", "ga", "tu", "de", "så", "pe", "li", "or"]
+    return ["".join(rng.choice(syllables) for _ in range(rng.randint(1, 5))) for _ in range(size)]
+
+def make_document(rng, vocabulary, categories, length, density):
+    """One text of length words and the (start, end, category) spans of its labelled words."""
+    words = [rng.choice(vocabulary) for _ in range(length)]
+    for i in range(0, length, rng.randint(8, 20)):
+        words[i] = words[i].capitalize()
+        if i:
+            words[i - 1] += "."
+    spans = []
+    offset = 0
+    i = 0
+    while i < length:
+        span_words = rng.randint(1, 3)
+        if rng.random() < density / 2:
+            start = offset
+            end = offset + len(" ".join(words[i:i + span_words]))
+            spans.append([start, end, rng.choice(categories)])
+        else:
+            span_words = 1
+        offset += len(" ".join(words[i:i + span_words])) + 1
+        i += span_words
+    return " ".join(words), spans
+
+def perturb(rng, spans, categories):
+    """Spans of another classifier: some missed, some relabelled, some with shifted boundaries, a few extra."""
+    result = []
+    for start, end, label in spans:
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        if roll < 0.2:
+            label = rng.choice(categories)
+        elif roll < 0.3 and end - start > 2:
+            end -= 1
+        result.append([start, end, label])
+    for start, end, _ in rng.sample(spans, len(spans) // 10):
+        result.append([start, end, rng.choice(categories)])
+    return sorted(result)
+
+def write_corpus(folder, seed, documents, length, density, classifiers, categories):
+    """Write classifier-<n>.jsonl files into folder. Returns their paths, the reference first."""
+    rng = random.Random(f"{seed}-{documents}-{length}-{density}-{classifiers}")
+    vocabulary = make_vocabulary(rng)
+    texts = [make_document(rng, vocabulary, categories, length, density) for _ in range(documents)]
+    paths = []
+    for n in range(classifiers):
+        path = os.path.join(folder, f"classifier-{n}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for doc_id, (text, spans) in enumerate(texts, start=1):
+                labels = spans if n == 0 else perturb(rng, spans, categories)
+                f.write(json.dumps({"id": str(doc_id), "text": text, "label": labels}, ensure_ascii=False) + "\n")
+        paths.append(path)
+    return paths
+
+# -----------------------------
+# Stage timings
+# -----------------------------
+class StageTimer:
+    """Accumulates wall clock time per stage."""
+
+    def __init__(self):
+        self.seconds = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+def clear_layout_caches():
+    """Start every run with cold font and word caches, as a fresh process would."""
+    texty_layout.load_font.cache_clear()
+    texty_layout.font_metrics.cache_clear()
+    texty_layout.word_box.cache_clear()
+
+def time_render(data_file, category_colors):
+    """Render every document of data_file stage by stage, without writing files."""
+    timer = StageTimer()
+    clear_layout_caches()
+    with timer.stage("parse"):
+        documents = [text_words(record, category_colors) for record in iter_records(data_file)]
+    for words in documents:
+        with timer.stage("font_fit"):
+            size, _ = find_best_font_size(words)
+        with timer.stage("wrap"):
+            lines = texty_layout.wrap_words(words, size)
+            layout = layout_lines(lines, size)
+        with timer.stage("rasterize"):
+            img = draw_png(layout)
+        with timer.stage("png_encode"):
+            save_png(img, io.BytesIO())
+        with timer.stage("thumbnail"):
+            save_png(draw_mini(layout), io.BytesIO())
+        with timer.stage("svg"):
+            write_svg(io.StringIO(), layout, category_colors)
+    return timer.seconds
+
+def time_export(workspace, data_files, config_path):
+    """
+    Run data_for_frontend.py on the corpus (its import is the "export_load"
+    stage: reading the data files and writing the export), then time its
+    alignment, statistics and search index functions on the loaded data.
+    """
+    cli = os.path.join(workspace, "APP-cli")
+    data = os.path.join(workspace, "Data")
+    public = os.path.join(workspace, "impersonal-frontend", "public")
+    for folder in [os.path.join(cli, "texty", "SVG"), data, public]:
+        shutil.rmtree(folder, ignore_errors=True)
+        os.makedirs(folder)
+    shutil.copy2(config_path, os.path.join(cli, "config.json"))
+    for path in data_files:
+        shutil.copy2(path, data)
+    reference = os.path.splitext(os.path.basename(data_files[0]))[0]
+
+    # Loading pandas is a one-off cost of the process, keep it out of the timings
+    importlib.import_module("pandas")
+    timer = StageTimer()
+    cwd, argv = os.getcwd(), sys.argv
+    sys.modules.pop("data_for_frontend", None)
+    try:
+        os.chdir(cli)
+        sys.argv = ["data_for_frontend.py", "--reference", reference]
+        with contextlib.redirect_stdout(io.StringIO()), timer.stage("export_load"):
+            export = importlib.import_module("data_for_frontend")
+        with timer.stage("alignment"):
+            aligned = export.create_aligned_table(export.label_aggregator)
+        # The statistics write their counts cache in the workspace, like the export
+        with timer.stage("stats"):
+            spans = export.build_counts_table(export.label_aggregator)
+            export.generate_label_statistics(spans)
+            export.generate_per_document_statistics(spans)
+        with timer.stage("agreement"):
+            export.generate_agreement_statistics(export.label_aggregator, reference)
+    finally:
+        os.chdir(cwd)
+        sys.argv = argv
+    span_records = json.loads(aligned.to_json(orient="records"))
+    with timer.stage("search_index"):
+        build_search_index(export.document_texts(), span_records, export.documents_by_file)
+    return timer.seconds
+
+def time_flask(workspace, data_file, config_path):
+    """Time /api/texty_gen (rendering in the request) for every document, through the Flask test client."""
+    flask_dir = os.path.join(workspace, "APP-flask")
+    shutil.rmtree(flask_dir, ignore_errors=True)
+    os.makedirs(os.path.join(flask_dir, "texts"))
+    shutil.copy2(config_path, os.path.join(flask_dir, "config.json"))
+    filenames = []
+    for record in iter_records(data_file):
+        filenames.append(f"doc{record['id']}.json")
+        with open(os.path.join(flask_dir, "texts", filenames[-1]), "w") as f:
+            json.dump(record, f)
+
+    timer = StageTimer()
+    cwd = os.getcwd()
+    sys.modules.pop("app", None)
+    try:
+        os.chdir(flask_dir)
+        sys.path.insert(0, FLASK_FOLDER)
+        import app
+        clear_layout_caches()
+        client = app.app.test_client()
+        for filename in filenames:
+            with timer.stage("texty_gen"):
+                response = client.post("/api/texty_gen", json={"filename": filename, "wait": True})
+            if response.status_code != 200:
+                raise RuntimeError(f"/api/texty_gen failed for {filename}: {response.status_code}")
+    finally:
+        sys.path.remove(FLASK_FOLDER)
+        os.chdir(cwd)
+    return timer.seconds
+
+def run_scenario(workspace, name, params, groups, repeat, seed, config_path):
+    """Run one scenario repeat times and keep the fastest time of each stage."""
+    categories = list(load_categories(config_path))
+    corpus = os.path.join(workspace, "corpora", name)
+    os.makedirs(corpus, exist_ok=True)
+    data_files = write_corpus(corpus, seed, params["documents"], params["length"], params["density"],
+                              params["classifiers"], categories)
+    category_colors = load_categories(config_path)
+    best = {}
+    for _ in range(repeat):
+        seconds = {}
+        if "render" in groups:
+            seconds.update(time_render(data_files[0], category_colors))
+        if "export" in groups:
+            seconds.update(time_export(workspace, data_files, config_path))
+        if "flask" in groups:
+            seconds.update(time_flask(workspace, data_files[0], config_path))
+        for stage, value in seconds.items():
+            best[stage] = min(value, best.get(stage, value))
+    stages = [stage for stage in RENDER_STAGES + EXPORT_STAGES + FLASK_STAGES if stage in best]
+    return {
+        "name": name,
+        "params": params,
+        "stages": {stage: {"seconds": best[stage], "ms_per_document": best[stage] / params["documents"] * 1000}
+                   for stage in stages},
+    }
+
+# -----------------------------
+# Reporting
+# -----------------------------
+def print_results(results):
+    for scenario in results["scenarios"]:
+        print(f"[✓] {scenario['name']}")
+        for stage, timing in scenario["stages"].items():
+            print(f"      {stage:<12} {timing['seconds']:9.4f} s  {timing['ms_per_document']:9.2f} ms/doc")
+
+def compare(results, baseline, tolerance):
+    """Print the change of every stage against the baseline. Returns the number of regressions."""
+    previous = {scenario["name"]: scenario for scenario in baseline["scenarios"]}
+    regressions = 0
+    for scenario in results["scenarios"]:
+        old = previous.get(scenario["name"])
+        if old is None:
+            print(f"[!] {scenario['name']} is not in the baseline")
+            continue
+        if old["params"] != scenario["params"]:
+            print(f"[!] {scenario['name']} was run with other parameters in the baseline, skipping")
+            continue
+        for stage, timing in scenario["stages"].items():
+            if stage not in old["stages"]:
+                continue
+            before, after = old["stages"][stage]["seconds"], timing["seconds"]
+            change = (after - before) / before if before else 0.0
+            regressed = change > tolerance and after - before > NOISE_SECONDS
+            regressions += regressed
+            mark = "[!]" if regressed else "[✓]"
+            print(f"{mark} {scenario['name']} {stage:<12} {before:9.4f} s -> {after:9.4f} s  ({change:+.1%})")
+    return regressions
+
+def main():
+    args = parse_arguments()
+    config_path = os.path.abspath(CONFIG_PATH)
+    if not os.path.isfile(config_path):
+        print(f"[!] Configuration file not found: {config_path}")
+        exit(1)
+    groups = {group.strip() for group in args.stages.split(",") if group.strip()}
+    unknown = groups - {"render", "export", "flask"}
+    if unknown:
+        print(f"[!] Unknown stage groups: {', '.join(sorted(unknown))} (choose from render, export, flask)")
+        exit(1)
+
+    grid = itertools.product(
+        [int(value) for value in args.lengths.split(",")],
+        [float(value) for value in args.densities.split(",")],
+        [int(value) for value in args.classifiers.split(",")],
+    )
+    workspace = tempfile.mkdtemp(prefix="texty-benchmark-")
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "scenarios": [],
+    }
+    try:
+        for length, density, classifiers in grid:
+            name = f"len{length}-dens{density:g}-cls{classifiers}"
+            params = {"documents": args.documents, "length": length, "density": density, "classifiers": classifiers}
+            results["scenarios"].append(run_scenario(workspace, name, params, groups, args.repeat, args.seed, config_path))
+    finally:
+        if args.keep:
+            print(f"[✓] Corpora and outputs kept in {workspace}")
+        else:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    print_results(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"[✓] Wrote results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"[!] {regressions} stages are more than {args.tolerance:.0%} slower than the baseline")
+            exit(1)
+        print("[✓] No regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
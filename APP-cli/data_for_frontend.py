@@ -1,19 +1,132 @@
 import os
 import json
+import gzip
 import shutil
+import hashlib
+import argparse
 import pandas as pd
 from glob import glob
 from collections import defaultdict, Counter
+from span_store import open_store
+from span_search import SEARCH_INDEX_NAME, build_search_index
+
+parser = argparse.ArgumentParser(description="Copy Texty SVGs and export label data for the frontend.")
+parser.add_argument('--reference', default="gv-pii-2.0_SweLLified", help="Data file (without .jsonl) that the other classifiers are scored against")
+parser.add_argument('--shard_size', type=int, default=0, help="Write index.json plus gzip shards of this many documents instead of the monolithic JSON files")
+parser.add_argument('--incremental', action='store_true', help="Only copy changed SVGs and skip the export when the data files did not change, using the export manifest")
+parser.add_argument('--link', action='store_true', help="Hardlink SVGs into the frontend folder instead of copying them")
+args = parser.parse_args()
+
+# Manifest for --incremental
+EXPORT_CACHE = "./texty/export_cache/"
+EXPORT_MANIFEST = EXPORT_CACHE + "manifest.json"
+# Label counts and agreement pair counts, named after the hashes of the data files they come from
+COUNTS_CACHE = EXPORT_CACHE + "counts/"
+
+def file_hash(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def file_state(path, previous):
+    """
+    Return the {size, mtime_ns, sha256} record of a file. The hash is reused
+    from the previous record when size and mtime are unchanged.
+    """
+    stat = os.stat(path)
+    state = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous and all(previous.get(key) == value for key, value in state.items()):
+        state["sha256"] = previous["sha256"]
+    else:
+        state["sha256"] = file_hash(path)
+    return state
+
+def publish_file(source, destination, link=False):
+    if os.path.exists(destination):
+        os.remove(destination)
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, destination)
+
+def load_export_manifest():
+    if args.incremental and os.path.isfile(EXPORT_MANIFEST):
+        with open(EXPORT_MANIFEST, "r") as f:
+            return json.load(f)
+    return {"svgs": {}, "data": {}, "outputs": None}
+
+def save_export_manifest(manifest):
+    os.makedirs(EXPORT_CACHE, exist_ok=True)
+    with open(EXPORT_MANIFEST + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(EXPORT_MANIFEST + ".tmp", EXPORT_MANIFEST)
+
+def cached_counts(name, compute):
+    """
+    Return the JSON counts cached in COUNTS_CACHE under name, or compute()
+    and cache them. The cache is only read with --incremental, but always
+    written so that the next incremental export can use it.
+    """
+    path = COUNTS_CACHE + name + ".json"
+    used_counts.add(os.path.basename(path))
+    if args.incremental and os.path.isfile(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    counts = compute()
+    os.makedirs(COUNTS_CACHE, exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(counts, f)
+    os.replace(path + ".tmp", path)
+    return counts
+
+def prune_counts_cache():
+    """Remove the cached counts of data file versions that were not used by this export."""
+    if os.path.isdir(COUNTS_CACHE):
+        for name in os.listdir(COUNTS_CACHE):
+            if name not in used_counts:
+                os.remove(COUNTS_CACHE + name)
+
+def load_data_file(file):
+    """
+    Read the texts and the (start, end, label) spans per document of a data
+    file from its memory-mapped span store, which is only rebuilt when the
+    file has changed. Returns (parsed, whether the file was parsed).
+    """
+    store, built = open_store(file)
+    texts, labels = [], {}
+    for position, id_ in enumerate(store.ids):
+        texts.append({"id": id_, "text": store.text(position)})
+        spans = store.spans(position)
+        if spans:
+            labels.setdefault(id_, []).extend(spans)
+    return {"texts": texts, "labels": labels}, built
+
+manifest = load_export_manifest()
 
 # Move SVG files
 svg_path = "./texty/SVG/"
 final_destination = "../impersonal-frontend/public/"
 config = "./config.json"
 svg_files = glob(svg_path+"*.svg")
+svg_states = {}
+copied = 0
 for svg_file in svg_files:
-    shutil.copy2(svg_file, final_destination)
+    name = os.path.basename(svg_file)
+    previous = manifest["svgs"].get(name)
+    svg_states[name] = file_state(svg_file, previous)
+    unchanged = previous and previous["sha256"] == svg_states[name]["sha256"]
+    if args.incremental and unchanged and os.path.exists(final_destination + name):
+        continue
+    publish_file(svg_file, final_destination + name, args.link)
+    copied += 1
+manifest["svgs"] = svg_states
 shutil.copy2(config, final_destination)
-print("[✓] Copied SVG files to "+final_destination)
+print(f"[✓] Copied {copied} of {len(svg_files)} SVG files to "+final_destination)
 
 # Transform data files
 data_path = "../Data/"
@@ -22,215 +135,422 @@ frontend_data = {}
 frontend_data["base_files"] = []
 frontend_data["texts"] = []
 label_aggregator = {}
+documents_by_file = {}
+# classifier -> {document_id: [(label, count), ...]} of its data file
+label_counts_by_file = {}
+data_hashes = {}
+used_counts = set()
+data_states = {}
 for file in data_files:
     basename = os.path.basename(file)
-    basename_noext = basename.split(".jsonl")[0]
-    frontend_data["base_files"].append(basename)
-    df = pd.read_json(file, lines=True)
-    for row in df.iterrows():
-        id_ = row[1].get("id")
-        text_ = row[1].get("text")
-        frontend_data["texts"].append({"id": id_, "text": text_})
-        labels_ = row[1].get("label")
-        for label in labels_:
-            label_start = label[0]
-            label_end = label[1]
-            label_type = label[2]
+    data_states[basename] = file_state(file, manifest["data"].get(basename))
+
+def load_data_files():
+    """Fill frontend_data, label_aggregator and documents_by_file from the data files."""
+    reparsed = 0
+    for file in data_files:
+        basename = os.path.basename(file)
+        basename_noext = basename.split(".jsonl")[0]
+        frontend_data["base_files"].append(basename)
+        parsed, changed = load_data_file(file)
+        reparsed += changed
+        frontend_data["texts"].extend(parsed["texts"])
+        documents_by_file[basename_noext] = {entry["id"] for entry in parsed["texts"]}
+        for id_, labels_ in parsed["labels"].items():
             if id_ not in label_aggregator:
                 label_aggregator[id_] = {}
-            if basename_noext not in label_aggregator[id_]:
-                label_aggregator[id_][basename_noext] = []
-            label_aggregator[id_][basename_noext].append((label_start, label_end, label_type))
+            label_aggregator[id_][basename_noext] = labels_
+        data_hashes[basename_noext] = data_states[basename]["sha256"]
+        counts = cached_counts("labels-" + data_hashes[basename_noext], lambda: [
+            [id_, list(Counter(label for _, _, label in labels_).items())] for id_, labels_ in parsed["labels"].items()])
+        label_counts_by_file[basename_noext] = {id_: doc_counts for id_, doc_counts in counts}
+    if args.incremental:
+        print(f"[✓] Reparsed {reparsed} of {len(data_files)} data files")
+
+def document_texts():
+    """Document texts by id (the first file listing a document wins)."""
+    texts_by_id = {}
+    for entry in frontend_data["texts"]:
+        texts_by_id.setdefault(entry["id"], entry["text"])
+    return texts_by_id
+
+def align_cluster(cluster, classifiers):
+    """
+    Align the spans of one overlap cluster into rows holding at most one span
+    per classifier. The spans of each classifier are paired in turn with the
+    rows built so far (pair_spans against the row extents), so partly
+    overlapping spans share a row and a row's extent grows to cover them.
+    A classifier's repeated spans at the same position keep the first label.
+    """
+    rows = []
+    for classifier in classifiers:
+        spans = []
+        for span in cluster.get(classifier, []):
+            if not spans or spans[-1][:2] != span[:2]:
+                spans.append(span)
+        extents = sorted(((row["start"], row["end"], row) for row in rows), key=lambda extent: extent[:2])
+        for extent, span in pair_spans(extents, spans):
+            if span is None:
+                continue
+            if extent is None:
+                row = {"start": span[0], "end": span[1], "spans": {}}
+                rows.append(row)
+            else:
+                row = extent[2]
+                row["start"], row["end"] = min(row["start"], span[0]), max(row["end"], span[1])
+            row["spans"][classifier] = span
+    return rows
 
 def create_aligned_table(data_dict):
-    """Create a table that aligns entries from different classifiers."""
-    # Get all document IDs
-    document_ids = list(data_dict.keys())
+    """
+    Create a table that aligns entries from different classifiers. Spans of
+    different classifiers that overlap share one row: start and end cover
+    all of them, and each classifier's own span is kept in its
+    <classifier>_start, <classifier>_end and <classifier>_label columns.
+    """
+    texts_by_id = document_texts()
     
     result = []
     
     # Process each document
-    for doc_id in document_ids:
-        doc_data = data_dict[doc_id]
+    for doc_id, doc_data in data_dict.items():
         classifiers = list(doc_data.keys())
-        doc_text = [x for x in frontend_data["texts"] if x["id"] == doc_id][0]["text"]
-        
-        # Get all unique positions across all classifiers for this document
-        all_positions = set()
-        for classifier in classifiers:
-            for start, end, label in doc_data[classifier]:
-                all_positions.add((start, end))
+        doc_text = texts_by_id[doc_id]
         
-        # Sort positions
-        all_positions = sorted(all_positions)
-        
-        # Create rows for each position
-        for start, end in all_positions:
-            # Extract the text span
-            span_text = doc_text[start:end] if 0 <= start < end <= len(doc_text) else ""
-            
-            row = {
-                'document_id': doc_id,
-                'start': start,
-                'end': end,
-                'text': span_text
-            }
-            
-            # Add classifier information
-            for classifier in classifiers:
-                # Find if there's a match for this position in this classifier
-                matches = [label for s, e, label in doc_data[classifier] if s == start and e == end]
-                row[f"{classifier}_label"] = matches[0] if matches else None
-            
-            result.append(row)
+        for cluster in overlap_clusters(doc_data):
+            for aligned in align_cluster(cluster, classifiers):
+                start, end = aligned["start"], aligned["end"]
+                # Extract the text span
+                span_text = doc_text[start:end] if 0 <= start < end <= len(doc_text) else ""
+                row = {
+                    'document_id': doc_id,
+                    'start': start,
+                    'end': end,
+                    'text': span_text
+                }
+                for classifier in classifiers:
+                    span = aligned["spans"].get(classifier)
+                    row[f"{classifier}_start"] = span[0] if span else None
+                    row[f"{classifier}_end"] = span[1] if span else None
+                    row[f"{classifier}_label"] = span[2] if span else None
+                result.append(row)
     
-    # Convert to DataFrame
+    # Convert to DataFrame, keeping the per-classifier offsets as integers
     df = pd.DataFrame(result)
+    offset_columns = [column for column in df.columns if column.endswith(("_start", "_end"))]
+    df[offset_columns] = df[offset_columns].astype("Int64")
     
     # Sort by document_id, start, end
-    df = df.sort_values(['document_id', 'start', 'end'])
+    df = df.sort_values(['document_id', 'start', 'end'], kind='stable')
     
     return df
 
-def generate_label_statistics(data_dict):
-    """Generate statistics about label usage across classifiers."""
-    # Initialize counters for each classifier
-    classifier_counters = defaultdict(Counter)
-    
-    # Count label occurrences for each classifier
+def build_counts_table(data_dict):
+    """
+    Merge the per-file label counts into one row per document, classifier
+    and label: document_id, classifier, label, count. Rows follow the label
+    aggregator, so classifiers appear in the same order as its spans.
+    """
+    document_ids, classifiers, labels, counts = [], [], [], []
     for doc_id, doc_data in data_dict.items():
-        for classifier, entries in doc_data.items():
-            for _, _, label in entries:
-                classifier_counters[classifier][label] += 1
-    
-    # Create statistics DataFrame
-    stats_data = []
-    
-    # Get all unique labels across all classifiers
-    all_labels = set()
-    for counter in classifier_counters.values():
-        all_labels.update(counter.keys())
-    
-    # Sort labels alphabetically for consistency
-    all_labels = sorted(all_labels)
+        for classifier in doc_data:
+            for label, count in label_counts_by_file[classifier][doc_id]:
+                document_ids.append(doc_id)
+                classifiers.append(classifier)
+                labels.append(label)
+                counts.append(count)
+    return pd.DataFrame({'document_id': document_ids, 'classifier': classifiers, 'label': labels,
+                         'count': pd.Series(counts, dtype="int64")})
+
+def generate_label_statistics(spans):
+    """Generate statistics about label usage across classifiers from the counts table."""
+    if spans.empty:
+        return pd.DataFrame([{'label': 'TOTAL'}])
     
-    # Create rows for each label
-    for label in all_labels:
-        row = {'label': label}
-        
-        # Add count for each classifier
-        for classifier in classifier_counters.keys():
-            row[classifier] = classifier_counters[classifier][label]
-            # Also add percentage
-            total_labels = sum(classifier_counters[classifier].values())
-            if total_labels > 0:
-                row[f"{classifier}_pct"] = (classifier_counters[classifier][label] / total_labels) * 100
-            else:
-                row[f"{classifier}_pct"] = 0.0
-        
-        stats_data.append(row)
+    # Count labels per classifier (classifiers keep their order of first appearance)
+    classifiers = list(pd.unique(spans['classifier']))
+    counts = spans.groupby(['label', 'classifier'])['count'].sum().unstack(fill_value=0)[classifiers]
+    totals = counts.sum()
     
-    # Add total row
+    # Interleave count and percentage columns for each classifier
+    stats_df = pd.DataFrame({'label': counts.index})
     total_row = {'label': 'TOTAL'}
-    for classifier in classifier_counters.keys():
-        total_row[classifier] = sum(classifier_counters[classifier].values())
+    for classifier in classifiers:
+        stats_df[classifier] = counts[classifier].values
+        stats_df[f"{classifier}_pct"] = (counts[classifier] / totals[classifier] * 100).values
+        total_row[classifier] = totals[classifier]
         total_row[f"{classifier}_pct"] = 100.0
     
-    stats_data.append(total_row)
-    
-    # Convert to DataFrame
-    stats_df = pd.DataFrame(stats_data)
-    
-    return stats_df
+    # Add total row
+    return pd.concat([stats_df, pd.DataFrame([total_row])], ignore_index=True)
 
-def generate_per_document_statistics(data_dict):
-    """Generate statistics about label usage for each document and classifier."""
-    # Initialize data structure for statistics
-    stats_data = []
+def generate_per_document_statistics(spans):
+    """Generate statistics about label usage for each document and classifier from the counts table."""
+    if spans.empty:
+        return pd.DataFrame()
+    classifiers = sorted(pd.unique(spans['classifier']))
     
-    # Get all unique classifiers
-    all_classifiers = set()
-    for doc_data in data_dict.values():
-        all_classifiers.update(doc_data.keys())
-    all_classifiers = sorted(all_classifiers)
+    # Per (document, label) counts, and per document totals, for each classifier
+    counts = (spans.groupby(['document_id', 'label', 'classifier'])['count'].sum()
+              .unstack(fill_value=0).reindex(columns=classifiers, fill_value=0))
+    totals = (spans.groupby(['document_id', 'classifier'])['count'].sum()
+              .unstack(fill_value=0).reindex(columns=classifiers, fill_value=0))
+    doc_totals = totals.reindex(counts.index.get_level_values('document_id'))
+    percentages = (counts / doc_totals.values * 100).fillna(0.0)
     
-    # Get all unique labels
-    all_labels = set()
-    for doc_data in data_dict.values():
-        for entries in doc_data.values():
-            all_labels.update(label for _, _, label in entries)
-    all_labels = sorted(all_labels)
+    label_rows = counts.reset_index()[['document_id', 'label']]
+    total_rows = pd.DataFrame({'document_id': totals.index, 'label': 'TOTAL'})
+    for classifier in classifiers:
+        label_rows[f"{classifier}_count"] = counts[classifier].values
+        label_rows[f"{classifier}_pct"] = percentages[classifier].values
+        total_rows[f"{classifier}_count"] = totals[classifier].values
+        total_rows[f"{classifier}_pct"] = (totals[classifier].values > 0) * 100.0
     
-    # Process each document
-    for doc_id, doc_data in data_dict.items():
-        # Count label occurrences for each classifier in this document
-        classifier_counters = {classifier: Counter() for classifier in all_classifiers}
-        
-        for classifier, entries in doc_data.items():
-            for _, _, label in entries:
-                classifier_counters[classifier][label] += 1
-        
-        # Create rows for each label in this document
-        for label in all_labels:
-            # Skip if this label doesn't appear in this document
-            if all(counter[label] == 0 for counter in classifier_counters.values()):
-                continue
-                
-            row = {
-                'document_id': doc_id,
-                'label': label
-            }
-            
-            # Add count for each classifier
-            for classifier in all_classifiers:
-                count = classifier_counters[classifier][label]
-                row[f"{classifier}_count"] = count
-                
-                # Add percentage if the classifier has annotations for this document
-                total = sum(classifier_counters[classifier].values())
-                if total > 0:
-                    row[f"{classifier}_pct"] = (count / total) * 100
-                else:
-                    row[f"{classifier}_pct"] = 0.0
-            
-            stats_data.append(row)
-        
-        # Add a total row for this document
-        total_row = {
-            'document_id': doc_id,
-            'label': 'TOTAL'
-        }
-        
-        for classifier in all_classifiers:
-            total_count = sum(classifier_counters[classifier].values())
-            total_row[f"{classifier}_count"] = total_count
-            total_row[f"{classifier}_pct"] = 100.0 if total_count > 0 else 0.0
-        
-        stats_data.append(total_row)
-    
-    # Convert to DataFrame
-    stats_df = pd.DataFrame(stats_data)
-    
-    # Sort by document_id and label
-    if not stats_df.empty:
-        stats_df = stats_df.sort_values(['document_id', 'label'])
-        
-        # Move TOTAL rows to the end of each document group
-        def custom_sort(label):
-            return (0 if label == 'TOTAL' else 1, label)
-        
-        stats_df['sort_key'] = stats_df['label'].apply(custom_sort)
-        stats_df = stats_df.sort_values(['document_id', 'sort_key'])
-        stats_df = stats_df.drop('sort_key', axis=1)
+    # Sort by document_id, with the TOTAL row first in each document, then by label
+    stats_df = pd.concat([total_rows, label_rows], ignore_index=True)
+    stats_df['sort_key'] = stats_df['label'] != 'TOTAL'
+    stats_df = stats_df.sort_values(['document_id', 'sort_key', 'label'], kind='stable')
+    stats_df = stats_df.drop('sort_key', axis=1)
     
     return stats_df
 
-df2 = create_aligned_table(label_aggregator)
-label_stats = generate_label_statistics(label_aggregator)
-frontend_data["stats"] = json.loads(label_stats.to_json(orient="records"))
-label_stats2 = generate_per_document_statistics(label_aggregator)
-frontend_data["stats_by_doc"] = json.loads(label_stats2.to_json(orient="records"))
-json.dump({"data": json.loads(df2.to_json(orient="records"))}, open(final_destination+"span_data.json", "w"))
-with open(final_destination+"frontend_data.json", "w") as out:
-    out.write(json.dumps(frontend_data))
-print("[✓] Wrote frontend data to "+final_destination)
\ No newline at end of file
+def overlap_clusters(doc_data):
+    """
+    Group the spans of all classifiers in a document into clusters of
+    (transitively) overlapping spans, with one sweep over the spans sorted by
+    start. Yields a {classifier: [(start, end, label), ...]} dict per cluster.
+    """
+    spans = sorted(
+        ((start, end, classifier, label)
+         for classifier, entries in doc_data.items()
+         for start, end, label in entries),
+        key=lambda span: (span[0], span[1])
+    )
+    cluster, cluster_end = None, None
+    for start, end, classifier, label in spans:
+        if cluster is None or start >= cluster_end:
+            if cluster is not None:
+                yield cluster
+            cluster, cluster_end = defaultdict(list), end
+        cluster[classifier].append((start, end, label))
+        cluster_end = max(cluster_end, end)
+    if cluster is not None:
+        yield cluster
+
+def pair_spans(reference, predicted):
+    """
+    Pair overlapping reference and predicted spans one-to-one with a
+    two-pointer sweep (both lists sorted by start). Yields
+    (reference_span, predicted_span) with None for an unpaired side.
+    """
+    i = j = 0
+    while i < len(reference) and j < len(predicted):
+        ref, pred = reference[i], predicted[j]
+        if ref[1] <= pred[0]:
+            yield ref, None
+            i += 1
+        elif pred[1] <= ref[0]:
+            yield None, pred
+            j += 1
+        else:
+            yield ref, pred
+            i += 1
+            j += 1
+    for ref in reference[i:]:
+        yield ref, None
+    for pred in predicted[j:]:
+        yield None, pred
+
+def cohens_kappa(pair_counts):
+    """Cohen's kappa over paired span labels, with None (no span) as its own category."""
+    total = sum(pair_counts.values())
+    if total == 0:
+        return None
+    observed = sum(count for (ref, pred), count in pair_counts.items() if ref == pred) / total
+    ref_totals, pred_totals = Counter(), Counter()
+    for (ref, pred), count in pair_counts.items():
+        ref_totals[ref] += count
+        pred_totals[pred] += count
+    expected = sum(ref_totals[label] * pred_totals[label] for label in ref_totals) / (total * total)
+    if expected == 1:
+        return 1.0
+    return (observed - expected) / (1 - expected)
+
+def count_label_pairs(data_dict, reference, classifier):
+    """
+    Pair the overlapping spans of classifier with those of the reference in
+    the documents present in both files. Returns [[reference_label,
+    predicted_label, count], ...] with None for an unpaired side.
+    """
+    pair_counts = Counter()
+    for doc_id in documents_by_file[reference] & documents_by_file[classifier]:
+        for cluster in overlap_clusters(data_dict.get(doc_id, {})):
+            ref_spans = cluster.get(reference, [])
+            for ref, pred in pair_spans(ref_spans, cluster.get(classifier, [])):
+                pair_counts[(ref[2] if ref else None, pred[2] if pred else None)] += 1
+    return [[ref, pred, count] for (ref, pred), count in pair_counts.items()]
+
+def generate_agreement_statistics(data_dict, reference):
+    """
+    Score every classifier against the reference file. Overlapping spans are
+    paired (boundaries need not match exactly); a pair with equal labels is a
+    true positive, anything else counts as a false positive for the predicted
+    label and/or a false negative for the reference label. Only documents
+    present in both files are scored. The pair counts are cached per pair of
+    data file hashes. Returns per-label precision, recall and F1 (plus a
+    micro-averaged TOTAL row) and Cohen's kappa per classifier.
+    """
+    classifiers = sorted(name for name in documents_by_file if name != reference)
+    pair_counts = {}
+    for classifier in classifiers:
+        pairs = cached_counts(f"pairs-{data_hashes[reference]}-{data_hashes[classifier]}",
+                              lambda: count_label_pairs(data_dict, reference, classifier))
+        pair_counts[classifier] = Counter({(ref, pred): count for ref, pred, count in pairs})
+
+    rows = []
+    kappa = {}
+    for classifier in classifiers:
+        counts = pair_counts[classifier]
+        tp, fp, fn = Counter(), Counter(), Counter()
+        for (ref, pred), count in counts.items():
+            if ref is not None and ref == pred:
+                tp[ref] += count
+                continue
+            if pred is not None:
+                fp[pred] += count
+            if ref is not None:
+                fn[ref] += count
+        labels = sorted(set(tp) | set(fp) | set(fn))
+        for label in labels + ['TOTAL']:
+            if label == 'TOTAL':
+                l_tp, l_fp, l_fn = sum(tp.values()), sum(fp.values()), sum(fn.values())
+            else:
+                l_tp, l_fp, l_fn = tp[label], fp[label], fn[label]
+            precision = l_tp / (l_tp + l_fp) if l_tp + l_fp > 0 else 0.0
+            recall = l_tp / (l_tp + l_fn) if l_tp + l_fn > 0 else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+            rows.append({
+                'classifier': classifier,
+                'label': label,
+                'tp': l_tp,
+                'fp': l_fp,
+                'fn': l_fn,
+                'precision': precision,
+                'recall': recall,
+                'f1': f1
+            })
+        kappa[classifier] = cohens_kappa(counts)
+
+    return pd.DataFrame(rows), kappa
+
+def document_title(text, max_length=80):
+    """Short title for a document: its first words, up to max_length characters."""
+    text = " ".join((text or "").split())
+    if len(text) <= max_length:
+        return text
+    return text[:max_length].rsplit(" ", 1)[0] + "…"
+
+def write_gzip_json(path, data):
+    # mtime=0 keeps the output identical when the data has not changed
+    with open(path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as out:
+        out.write(json.dumps(data).encode("utf-8"))
+
+def write_shards(frontend_data, span_records, spans_table, destination, shard_size):
+    """
+    Write index.json (document ids, titles, label counts per classifier,
+    shard locations and the corpus-wide stats) and one gzip-compressed shard
+    per block of shard_size documents holding their texts, aligned spans
+    and per-document stats.
+    """
+    shard_folder = os.path.join(destination, "shards")
+    shutil.rmtree(shard_folder, ignore_errors=True)
+    os.makedirs(shard_folder)
+
+    texts_by_id = document_texts()
+    spans_by_id = defaultdict(list)
+    for row in span_records:
+        spans_by_id[row["document_id"]].append(row)
+    stats_by_id = defaultdict(list)
+    for row in frontend_data["stats_by_doc"]:
+        stats_by_id[row["document_id"]].append(row)
+    label_counts = spans_table.groupby(['document_id', 'classifier'])['count'].sum()
+
+    documents = []
+    doc_ids = list(texts_by_id)
+    for shard_number, first in enumerate(range(0, len(doc_ids), shard_size)):
+        shard_ids = doc_ids[first:first + shard_size]
+        shard_name = f"shards/shard-{shard_number:05d}.json.gz"
+        write_gzip_json(os.path.join(destination, shard_name), {
+            "texts": [{"id": id_, "text": texts_by_id[id_]} for id_ in shard_ids],
+            "spans": [row for id_ in shard_ids for row in spans_by_id[id_]],
+            "stats_by_doc": [row for id_ in shard_ids for row in stats_by_id[id_]]
+        })
+        for id_ in shard_ids:
+            counts = label_counts[id_].to_dict() if id_ in label_counts.index else {}
+            documents.append({
+                "id": id_,
+                "title": document_title(texts_by_id[id_]),
+                "label_counts": {classifier: int(count) for classifier, count in counts.items()},
+                "shard": shard_name
+            })
+
+    index = {key: value for key, value in frontend_data.items() if key not in ("texts", "stats_by_doc")}
+    index["documents"] = documents
+    with open(os.path.join(destination, "index.json"), "w") as out:
+        out.write(json.dumps(index))
+    return len(documents), -(-len(documents) // shard_size)
+
+def write_search_index(span_records, destination):
+    """Write the inverted index of the texts and labelled spans queried by the Flask app's /api/search."""
+    index = build_search_index(document_texts(), span_records, documents_by_file)
+    write_gzip_json(os.path.join(destination, SEARCH_INDEX_NAME), index)
+    return len(index["tokens"]), len(index["spans"])
+
+def export_frontend_data():
+    """Compute the aligned spans and statistics and write the frontend data files."""
+    df2 = create_aligned_table(label_aggregator)
+    spans_table = build_counts_table(label_aggregator)
+    label_stats = generate_label_statistics(spans_table)
+    frontend_data["stats"] = json.loads(label_stats.to_json(orient="records"))
+    label_stats2 = generate_per_document_statistics(spans_table)
+    frontend_data["stats_by_doc"] = json.loads(label_stats2.to_json(orient="records"))
+    if args.reference in documents_by_file:
+        agreement, kappa = generate_agreement_statistics(label_aggregator, args.reference)
+        frontend_data["agreement"] = {
+            "reference": args.reference,
+            "by_label": json.loads(agreement.to_json(orient="records")),
+            "kappa": kappa
+        }
+    else:
+        print(f"[!] Reference file {args.reference}.jsonl not found, skipping agreement statistics")
+    span_records = json.loads(df2.to_json(orient="records"))
+    n_tokens, n_spans = write_search_index(span_records, final_destination)
+    print(f"[✓] Wrote search index of {n_tokens} words and {n_spans} span texts to {final_destination}{SEARCH_INDEX_NAME}")
+    if args.shard_size > 0:
+        n_documents, n_shards = write_shards(frontend_data, span_records, spans_table, final_destination, args.shard_size)
+        print(f"[✓] Wrote index and {n_shards} shards for {n_documents} documents to {final_destination}")
+    else:
+        # Drop a stale sharded export so the frontend reads the monolithic files
+        if os.path.exists(final_destination+"index.json"):
+            os.remove(final_destination+"index.json")
+            shutil.rmtree(final_destination+"shards", ignore_errors=True)
+        json.dump({"data": span_records}, open(final_destination+"span_data.json", "w"))
+        with open(final_destination+"frontend_data.json", "w") as out:
+            out.write(json.dumps(frontend_data))
+        print("[✓] Wrote frontend data to "+final_destination)
+
+# Skip the export when neither the data files nor the export options changed
+outputs_signature = hashlib.sha256(json.dumps(
+    [sorted((name, state["sha256"]) for name, state in data_states.items()), args.reference, args.shard_size]
+).encode("utf-8")).hexdigest()
+output_file = final_destination + ("index.json" if args.shard_size > 0 else "frontend_data.json")
+if (args.incremental and manifest.get("outputs") == outputs_signature and os.path.exists(output_file)
+        and os.path.exists(final_destination + SEARCH_INDEX_NAME)):
+    print("[✓] Frontend data is up to date")
+else:
+    load_data_files()
+    export_frontend_data()
+    prune_counts_cache()
+manifest["data"] = data_states
+manifest["outputs"] = outputs_signature
+save_export_manifest(manifest)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Byte-offset index of the JSONL files in a data folder, for reading a single
+document by id without parsing the whole file.
+
+The index maps every file name to {id: [offset, length]} and is stored in
+INDEX_NAME inside the folder, together with the size and mtime of each file
+so that only changed files are scanned again. Records are read from a
+memory map of their file.
+
+    python record_index.py ../Data      # build or refresh the index
+"""
+import os
+import sys
+import json
+import mmap
+import threading
+from glob import glob, escape
+from record_stream import normalize_id, validate_record
+
+INDEX_NAME = ".record_index.json"
+INDEX_VERSION = 1
+
+# path -> (size, mtime_ns, mmap) of the files read so far
+_maps = {}
+_maps_lock = threading.Lock()
+
+def file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def index_file(path):
+    """Scan one JSONL file. Returns {id: [offset, length]}; the first record wins for duplicate ids."""
+    documents = {}
+    offset = 0
+    with open(path, "rb") as f:
+        for line_number, line in enumerate(f, start=1):
+            length = len(line)
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                    error = validate_record(record)
+                except ValueError as e:
+                    error = f"invalid JSON ({e})"
+                if error:
+                    print(f"[!] Not indexing line {line_number} of {path}: {error}")
+                else:
+                    documents.setdefault(str(normalize_id(record["id"])), [offset, length])
+            offset += length
+    return documents
+
+def load_index(folder):
+    path = os.path.join(folder, INDEX_NAME)
+    if os.path.isfile(path):
+        with open(path, "r") as f:
+            index = json.load(f)
+        if index.get("version") == INDEX_VERSION:
+            return index
+    return {"version": INDEX_VERSION, "files": {}}
+
+def save_index(folder, index):
+    path = os.path.join(folder, INDEX_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+def refresh_index(folder, index=None):
+    """
+    Bring the index of folder up to date: files whose size or mtime changed
+    are scanned again and deleted files are dropped. The index is saved when
+    it changed. Returns (index, number of files scanned).
+    """
+    if index is None:
+        index = load_index(folder)
+    files = {os.path.basename(path): path for path in glob(os.path.join(escape(folder), "*.jsonl"))}
+    scanned = 0
+    for name in sorted(files):
+        size, mtime_ns = file_signature(files[name])
+        entry = index["files"].get(name)
+        if entry and entry["size"] == size and entry["mtime_ns"] == mtime_ns:
+            continue
+        index["files"][name] = {"size": size, "mtime_ns": mtime_ns, "documents": index_file(files[name])}
+        scanned += 1
+    removed = [name for name in index["files"] if name not in files]
+    for name in removed:
+        del index["files"][name]
+    if scanned or removed:
+        save_index(folder, index)
+    return index, scanned
+
+def open_map(path):
+    """Memory map of path, reopened when the file has changed since it was mapped."""
+    signature = file_signature(path)
+    with _maps_lock:
+        cached = _maps.get(path)
+        if cached and cached[:2] == signature:
+            return cached[2]
+        if cached and cached[2] is not None:
+            cached[2].close()
+        mapped = None
+        if signature[0] > 0:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _maps[path] = signature + (mapped,)
+        return mapped
+
+def read_record(folder, index, name, doc_id):
+    """
+    Read document doc_id of the data file name through the index. Returns the
+    record, or None when the file or id is unknown. A file that changed since
+    it was indexed is scanned again first.
+    """
+    entry = index["files"].get(name)
+    path = os.path.join(folder, name)
+    if entry is None or not os.path.isfile(path):
+        return None
+    if file_signature(path) != (entry["size"], entry["mtime_ns"]):
+        refresh_index(folder, index)
+        entry = index["files"][name]
+    location = entry["documents"].get(str(doc_id))
+    if location is None:
+        return None
+    offset, length = location
+    mapped = open_map(path)
+    if mapped is None or offset + length > len(mapped):
+        return None
+    record = json.loads(mapped[offset:offset + length])
+    record["id"] = normalize_id(record["id"])
+    return record
+
+def find_document(index, doc_id):
+    """Names of the data files that contain doc_id."""
+    return [name for name, entry in sorted(index["files"].items()) if str(doc_id) in entry["documents"]]
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join("..", "Data")
+    if not os.path.isdir(folder):
+        print(f"[!] Data folder not found: {folder}")
+        exit(1)
+    index, scanned = refresh_index(folder)
+    documents = sum(len(entry["documents"]) for entry in index["files"].values())
+    print(f"[✓] Indexed {documents} documents in {len(index['files'])} files ({scanned} scanned) into {os.path.join(folder, INDEX_NAME)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import json
+
+# Read JSON arrays in chunks of this many characters
+CHUNK_SIZE = 1 << 16
+
+_decoder = json.JSONDecoder()
+
+
+def normalize_id(value):
+    """Turn numeric string ids ("181") into ints, as pandas.read_json used to."""
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+def validate_record(record):
+    """Return an error message if record is not a usable {id, text, label} object, else None."""
+    if not isinstance(record, dict):
+        return "not a JSON object"
+    if record.get("id") in (None, ""):
+        return "missing 'id'"
+    if not isinstance(record.get("text", ""), str):
+        return "'text' is not a string"
+    labels = record.get("label", [])
+    if not isinstance(labels, list):
+        return "'label' is not a list"
+    for label in labels:
+        if not (isinstance(label, list) and len(label) == 3
+                and isinstance(label[0], int) and isinstance(label[1], int) and isinstance(label[2], str)):
+            return f"invalid label {label!r}"
+    return None
+
+
+def _iter_array(f, buf):
+    """Yield (line, value, error) for each element of a JSON array, reading f in chunks."""
+    start = buf.index("[")
+    pos, line, eof = start + 1, 1 + buf.count("\n", 0, start), False
+    while True:
+        # Skip whitespace and separators, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                if buf[pos] == "\n":
+                    line += 1
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            chunk = f.read(CHUNK_SIZE)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+        if pos >= len(buf) or buf[pos] == "]":
+            return
+        try:
+            value, end = _decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                # Elements cannot be resynchronised reliably, stop here
+                yield line, None, f"invalid JSON ({e.msg}), stopped reading"
+                return
+            chunk = f.read(CHUNK_SIZE)
+            buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+            continue
+        yield line, value, None
+        line += buf.count("\n", pos, end)
+        pos = end
+
+
+def _iter_values(path):
+    """Yield (line, value, error) for every JSON value in a JSONL or JSON array file."""
+    with open(path, "r", encoding="utf-8") as f:
+        head = f.read(CHUNK_SIZE)
+        if head.lstrip().startswith("["):
+            yield from _iter_array(f, head)
+            return
+        f.seek(0)
+        for line, text in enumerate(f, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text), None
+            except json.JSONDecodeError as e:
+                yield line, None, f"invalid JSON ({e.msg})"
+
+
+def iter_records(path, errors=None):
+    """
+    Stream validated records from a JSONL file or a JSON array file, one at a
+    time, without loading the whole file. Invalid lines and records are
+    reported and skipped. If an errors list is given, (line, message) pairs
+    are appended to it as well.
+    """
+    for line, value, error in _iter_values(path):
+        if error is None:
+            error = validate_record(value)
+        if error:
+            print(f"[!] Skipping record at line {line} of {path}: {error}")
+            if errors is not None:
+                errors.append((line, error))
+            continue
+        value["id"] = normalize_id(value["id"])
+        yield value
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Inverted index from token and span text to the labelled spans of every
+classifier. It is written by data_for_frontend.py next to the frontend data
+and queried by the Flask app (/api/search).
+
+Terms are the lower-cased words of a text (runs of \\w), joined by spaces.
+"tokens" maps every word of the documents to postings (document, classifier,
+label, offset): words inside a labelled span get one posting per classifier
+that labelled it, other words one posting with classifier and label -1.
+"spans" maps the whole text of each labelled span to postings (document,
+classifier, label, start, end, agreed), where agreed is 1 when every
+classifier that has the document gave the same label to that span (or one
+overlapping it). Document
+ids, classifiers and labels are stored once and referred to by position, and
+the postings of a term are one flat list of integers sorted by document and
+offset.
+
+    python span_search.py ../impersonal-frontend/public/search_index.json.gz Santiago --label geographic
+"""
+import re
+import json
+import gzip
+import argparse
+from array import array
+from itertools import compress
+from collections import defaultdict
+
+SEARCH_INDEX_NAME = "search_index.json.gz"
+SEARCH_INDEX_VERSION = 1
+TOKEN_STRIDE = 4
+SPAN_STRIDE = 6
+WORD = re.compile(r"\w+")
+
+def terms(text):
+    """The lower-cased words of text."""
+    return WORD.findall((text or "").casefold())
+
+def span_key(text):
+    return " ".join(terms(text))
+
+def sorted_postings(postings, stride, key):
+    """Sort a flat posting list by key, a function of one posting."""
+    rows = sorted((postings[i:i + stride] for i in range(0, len(postings), stride)), key=key)
+    return [value for row in rows for value in row]
+
+def build_search_index(texts_by_id, span_records, documents_by_file):
+    """
+    Build the index from the document texts ({id: text}), the aligned span
+    rows of create_aligned_table (overlapping spans of all classifiers, with
+    "<classifier>_start", "_end" and "_label" columns per classifier) and the
+    ids of the documents in each classifier's data file.
+    """
+    documents = list(texts_by_id)
+    classifiers = sorted(documents_by_file)
+    labels = {}
+    tokens, spans = defaultdict(list), defaultdict(list)
+    rows_by_id = defaultdict(list)
+    for row in span_records:
+        rows_by_id[row["document_id"]].append(row)
+
+    for doc, id_ in enumerate(documents):
+        text = texts_by_id[id_] or ""
+        present = [code for code, classifier in enumerate(classifiers) if id_ in documents_by_file[classifier]]
+        labelled_offsets = set()
+        for row in rows_by_id[id_]:
+            given = [(code, row.get(f"{classifiers[code]}_label")) for code in present]
+            agreed = int(len({label for _, label in given}) == 1)
+            for code, label in given:
+                if label is None:
+                    continue
+                start, end = row[f"{classifiers[code]}_start"], row[f"{classifiers[code]}_end"]
+                span_text = text[start:end] if 0 <= start < end <= len(text) else ""
+                key = span_key(span_text)
+                label_code = labels.setdefault(label, len(labels))
+                if key:
+                    spans[key].extend((doc, code, label_code, start, end, agreed))
+                for match in WORD.finditer(span_text):
+                    offset = start + match.start()
+                    tokens[match.group().casefold()].extend((doc, code, label_code, offset))
+                    labelled_offsets.add(offset)
+        for match in WORD.finditer(text):
+            if match.start() not in labelled_offsets:
+                tokens[match.group().casefold()].extend((doc, -1, -1, match.start()))
+
+    return {
+        "version": SEARCH_INDEX_VERSION,
+        "documents": documents,
+        "classifiers": classifiers,
+        "labels": sorted(labels, key=labels.get),
+        "tokens": {term: sorted_postings(postings, TOKEN_STRIDE, lambda p: (p[0], p[3], p[1]))
+                   for term, postings in sorted(tokens.items())},
+        "spans": {term: sorted_postings(postings, SPAN_STRIDE, lambda p: (p[0], p[3], p[4], p[1]))
+                  for term, postings in sorted(spans.items())}
+    }
+
+def load_search_index(path):
+    """Load an index written with build_search_index, keeping the postings as integer arrays."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != SEARCH_INDEX_VERSION:
+        raise ValueError(f"unsupported search index version {index.get('version')}")
+    for field in ("tokens", "spans"):
+        index[field] = {term: array("i", postings) for term, postings in index[field].items()}
+    return index
+
+class Hits:
+    """
+    The hits of a search, as positions in a posting list (or ready-made
+    (postings, position) pairs). Pairs are only built for the slice that is
+    requested, so large unfiltered results cost nothing until they are paged.
+    """
+    def __init__(self, postings=None, positions=(), pairs=None):
+        self.postings, self.positions, self.pairs = postings, positions, pairs
+
+    def __len__(self):
+        return len(self.pairs) if self.pairs is not None else len(self.positions)
+
+    def __getitem__(self, item):
+        if self.pairs is not None:
+            return self.pairs[item]
+        if isinstance(item, slice):
+            return [(self.postings, i) for i in self.positions[item]]
+        return self.postings, self.positions[item]
+
+def matching(postings, stride, conditions):
+    """Positions of the postings whose field (offset in the posting) equals value for every (field, value) of conditions."""
+    positions = range(0, len(postings), stride)
+    for number, (field, value) in enumerate(conditions):
+        if number == 0:
+            positions = list(compress(positions, map(value.__eq__, postings[field::stride])))
+        else:
+            positions = [i for i in positions if postings[i + field] == value]
+    return positions
+
+def search(index, query, match="span", label=None, classifier=None, agreed=None):
+    """
+    Find query in the index. With match="span", the postings of the labelled
+    spans whose whole text is query; with match="token", the postings of the
+    words of query in the documents that contain all of them. label and
+    classifier restrict the postings to that label and classifier name, and
+    agreed (spans only) to spans that all classifiers did or did not label
+    alike. Returns the Hits, see posting().
+    """
+    conditions = []
+    for field, name, table in ((1, classifier, "classifiers"), (2, label, "labels")):
+        if name is not None:
+            if name not in index[table]:
+                return Hits(pairs=[])
+            conditions.append((field, index[table].index(name)))
+
+    if match == "span":
+        postings = index["spans"].get(span_key(query))
+        if postings is None:
+            return Hits(pairs=[])
+        if agreed is not None:
+            conditions.append((5, int(agreed)))
+        return Hits(postings, matching(postings, SPAN_STRIDE, conditions))
+
+    lists = [index["tokens"].get(word) for word in dict.fromkeys(terms(query))]
+    if not lists or any(postings is None for postings in lists):
+        return Hits(pairs=[])
+    if len(lists) == 1:
+        return Hits(lists[0], matching(lists[0], TOKEN_STRIDE, conditions))
+    documents = set(lists[0][0::TOKEN_STRIDE])
+    for postings in lists[1:]:
+        documents &= set(postings[0::TOKEN_STRIDE])
+    pairs = [(postings, i) for postings in lists for i in matching(postings, TOKEN_STRIDE, conditions)
+             if postings[i] in documents]
+    pairs.sort(key=lambda pair: (pair[0][pair[1]], pair[0][pair[1] + 3], pair[0][pair[1] + 1]))
+    return Hits(pairs=pairs)
+
+def posting(index, hit, match="span"):
+    """A hit of search() as a dict."""
+    postings, i = hit
+    result = {
+        "document_id": index["documents"][postings[i]],
+        "classifier": index["classifiers"][postings[i + 1]] if postings[i + 1] >= 0 else None,
+        "label": index["labels"][postings[i + 2]] if postings[i + 2] >= 0 else None
+    }
+    if match == "span":
+        result.update({"start": postings[i + 3], "end": postings[i + 4], "agreed": bool(postings[i + 5])})
+    else:
+        result["offset"] = postings[i + 3]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the search index written by data_for_frontend.py.")
+    parser.add_argument('index', help="Path of " + SEARCH_INDEX_NAME)
+    parser.add_argument('query', help="Span text, or words with --match token")
+    parser.add_argument('--match', choices=["span", "token"], default="span", help="Match whole labelled spans (default) or single words")
+    parser.add_argument('--label', help="Only postings with this label")
+    parser.add_argument('--classifier', help="Only postings of this classifier (data file name without .jsonl)")
+    parser.add_argument('--disagreed', action='store_true', help="Only spans that the classifiers did not all label alike")
+    parser.add_argument('--limit', type=int, default=20, help="Number of postings to print (default: 20)")
+    args = parser.parse_args()
+
+    index = load_search_index(args.index)
+    hits = search(index, args.query, args.match, args.label, args.classifier, 0 if args.disagreed else None)
+    for hit in hits[:args.limit]:
+        print(json.dumps(posting(index, hit, args.match)))
+    print(f"[✓] {len(hits)} postings")
+
+if __name__ == "__main__":
+    main()
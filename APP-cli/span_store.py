@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Columnar store of the documents and label spans of a data file, so that
+texty_gen_cli.py, data_for_frontend.py and the Flask app read them from a
+memory map instead of parsing the JSON again.
+
+The spans of all documents are kept in four int32 columns (document index,
+start, end and label code) ordered by document, with span_offsets giving the
+first span of every document. The texts are one UTF-8 string table with a
+text_offsets column, and the ids one JSON array with an id_offsets column.
+Label names are stored once in the JSON header, and the classifier is the
+data file itself. A store is built the first time a data file is read, into
+STORE_FOLDER inside the data folder, and rebuilt when the size or mtime of
+the file changes. Building streams every column to a temporary file, so it
+takes the same memory for any size of data file.
+
+    python span_store.py ../Data      # build or refresh the stores of a folder
+"""
+import os
+import sys
+import json
+import mmap
+import struct
+import shutil
+import tempfile
+import threading
+from array import array
+from glob import glob, escape
+from record_stream import iter_records
+from record_index import file_signature
+
+STORE_FOLDER = ".span_store"
+STORE_SUFFIX = ".spans"
+STORE_VERSION = 2
+MAGIC = b"TEXTYSP1"
+# Column values kept in memory before they are appended to their temporary file
+BLOCK_ITEMS = 1 << 16
+
+# store path -> SpanStore of the stores opened so far
+_stores = {}
+_stores_lock = threading.Lock()
+
+def store_path(data_file):
+    folder, name = os.path.split(os.path.abspath(data_file))
+    return os.path.join(folder, STORE_FOLDER, os.path.splitext(name)[0] + STORE_SUFFIX)
+
+class ColumnWriter:
+    """A column built in a temporary file, BLOCK_ITEMS values at a time (or raw bytes with typecode None)."""
+    def __init__(self, typecode, folder):
+        self.typecode = typecode
+        self.file = tempfile.TemporaryFile(dir=folder)
+        self.block = array(typecode) if typecode else None
+        self.length = 0
+
+    def append(self, value):
+        self.block.append(value)
+        if len(self.block) >= BLOCK_ITEMS:
+            self.flush()
+
+    def write(self, data):
+        self.file.write(data)
+        self.length += len(data)
+
+    def flush(self):
+        if self.block:
+            self.block.tofile(self.file)
+            self.length += len(self.block)
+            del self.block[:]
+
+    def __len__(self):
+        return self.length + (len(self.block) if self.typecode else 0)
+
+    def itemsize(self):
+        return self.block.itemsize if self.typecode else 1
+
+def build_store(data_file, signature, path):
+    """
+    Parse data_file into a store at path. signature is the (size, mtime_ns)
+    the file is read at. The columns are streamed to temporary files next to
+    path and copied after the header once the file has been read.
+    """
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    # 8 byte columns first, so that every column is aligned to its item size
+    columns = {name: ColumnWriter(typecode, folder) for name, typecode in [
+        ("text_offsets", "q"), ("span_offsets", "q"), ("id_offsets", "q"),
+        ("doc", "i"), ("start", "i"), ("end", "i"), ("label", "i"), ("missing_text", "B"),
+        ("texts", None), ("ids", None)]}
+    try:
+        labels = {}
+        for name in ("text_offsets", "span_offsets", "id_offsets"):
+            columns[name].append(0)
+        position = -1
+        for position, record in enumerate(iter_records(data_file)):
+            # every id follows the "[" or "," at its offset
+            columns["ids"].write(b"," if position else b"[")
+            columns["ids"].write(json.dumps(record["id"]).encode("utf-8"))
+            columns["id_offsets"].append(len(columns["ids"]))
+            columns["missing_text"].append(record.get("text") is None)
+            columns["texts"].write((record.get("text") or "").encode("utf-8"))
+            columns["text_offsets"].append(len(columns["texts"]))
+            for span_start, span_end, span_label in record.get("label", []):
+                columns["doc"].append(position)
+                columns["start"].append(span_start)
+                columns["end"].append(span_end)
+                columns["label"].append(labels.setdefault(span_label, len(labels)))
+            columns["span_offsets"].append(len(columns["doc"]))
+        columns["ids"].write(b"]" if position >= 0 else b"[]")
+
+        layout, offset = {}, 0
+        for name, column in columns.items():
+            column.flush()
+            layout[name] = [offset, column.typecode, len(column)]
+            offset += len(column) * column.itemsize()
+        header = json.dumps({
+            "version": STORE_VERSION,
+            "byteorder": sys.byteorder,
+            "source": list(signature),
+            "classifier": os.path.splitext(os.path.basename(data_file))[0],
+            "documents": position + 1,
+            "labels": sorted(labels, key=labels.get),
+            "columns": layout
+        }).encode("utf-8")
+        padding = -(len(MAGIC) + 4 + len(header)) % 8
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as out:
+                out.write(MAGIC + struct.pack("<I", len(header)) + header + b" " * padding)
+                for column in columns.values():
+                    column.file.seek(0)
+                    shutil.copyfileobj(column.file, out)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    finally:
+        for column in columns.values():
+            column.file.close()
+
+class SpanStore:
+    """Read-only view of a store held in a buffer, usually a memory map of the store file."""
+    def __init__(self, buffer):
+        view = memoryview(buffer)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError("not a span store")
+        (length,) = struct.unpack_from("<I", buffer, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(bytes(view[header_start:header_start + length]))
+        if self.header.get("version") != STORE_VERSION or self.header.get("byteorder") != sys.byteorder:
+            raise ValueError("span store of another version or byte order")
+        data = header_start + length + (-(header_start + length) % 8)
+
+        def column(name):
+            offset, typecode, count = self.header["columns"][name]
+            if typecode is None:
+                return view[data + offset:data + offset + count]
+            size = array(typecode).itemsize
+            return view[data + offset:data + offset + count * size].cast(typecode)
+
+        self.buffer = buffer
+        self.source = self.header["source"]
+        self.classifier = self.header["classifier"]
+        self.labels = self.header["labels"]
+        self.text_offsets = column("text_offsets")
+        self.span_offsets = column("span_offsets")
+        self.id_offsets = column("id_offsets")
+        self.doc = column("doc")
+        self.start = column("start")
+        self.end = column("end")
+        self.label = column("label")
+        self.missing_text = column("missing_text")
+        self.texts = column("texts")
+        self.id_table = column("ids")
+        self._ids = None
+        self._positions = None
+
+    def __len__(self):
+        return self.header["documents"]
+
+    @property
+    def ids(self):
+        """The ids of all documents, decoded from the id table the first time they are asked for."""
+        if self._ids is None:
+            self._ids = json.loads(bytes(self.id_table))
+        return self._ids
+
+    def id(self, position):
+        if self._ids is not None:
+            return self._ids[position]
+        return json.loads(bytes(self.id_table[self.id_offsets[position] + 1:self.id_offsets[position + 1]]))
+
+    def position(self, doc_id):
+        """Position of document doc_id (the first one for duplicate ids), or None."""
+        if self._positions is None:
+            positions = {}
+            for position, id_ in enumerate(self.ids):
+                positions.setdefault(str(id_), position)
+            self._positions = positions
+        return self._positions.get(str(doc_id))
+
+    def text(self, position):
+        if self.missing_text[position]:
+            return None
+        return str(self.texts[self.text_offsets[position]:self.text_offsets[position + 1]], "utf-8")
+
+    def spans(self, position):
+        """The (start, end, label) spans of the document at position."""
+        first, last = self.span_offsets[position], self.span_offsets[position + 1]
+        return list(zip(self.start[first:last], self.end[first:last], map(self.labels.__getitem__, self.label[first:last])))
+
+    def record(self, position):
+        """The document at position as an {id, text, label} record."""
+        record = {"id": self.id(position)}
+        if not self.missing_text[position]:
+            record["text"] = self.text(position)
+        record["label"] = [list(span) for span in self.spans(position)]
+        return record
+
+    def records(self):
+        for position in range(len(self)):
+            yield self.record(position)
+
+def map_store(path):
+    with open(path, "rb") as f:
+        return SpanStore(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+def load_store(path, signature):
+    """Memory map the store at path, or None when it is missing, unreadable or not built from signature."""
+    try:
+        store = map_store(path)
+    except (OSError, ValueError):
+        return None
+    return store if store.source == list(signature) else None
+
+def save_store(path, data_file, signature):
+    """
+    Build the store of data_file at path and memory map it. When path cannot
+    be written, the store is built in the temporary folder instead and only
+    kept open, not saved.
+    """
+    try:
+        build_store(data_file, signature, path)
+        return map_store(path)
+    except OSError as e:
+        print(f"[!] Could not save {path} ({e}), keeping the span store in a temporary file")
+    fd, tmp_path = tempfile.mkstemp(suffix=STORE_SUFFIX)
+    os.close(fd)
+    try:
+        build_store(data_file, signature, tmp_path)
+        return map_store(tmp_path)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            # the map keeps it open on Windows, it is left to the temporary folder
+            pass
+
+def open_store(data_file):
+    """
+    The store of data_file, built first when it is missing or the file has
+    changed since it was built. Returns (store, whether it was built).
+    """
+    path = store_path(data_file)
+    signature = file_signature(data_file)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is not None and store.source == list(signature):
+            return store, False
+        store = load_store(path, signature)
+        built = store is None
+        if built:
+            store = save_store(path, data_file, signature)
+        _stores[path] = store
+        return store, built
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join("..", "Data")
+    if not os.path.isdir(folder):
+        print(f"[!] Data folder not found: {folder}")
+        exit(1)
+    for data_file in sorted(glob(os.path.join(escape(folder), "*.jsonl"))):
+        store, built = open_store(data_file)
+        status = "Built" if built else "Up to date"
+        print(f"[✓] {status}: {store_path(data_file)} ({len(store)} documents, {len(store.doc)} spans)")
+
+if __name__ == "__main__":
+    main()
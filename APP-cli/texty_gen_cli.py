@@ -3,10 +3,20 @@
 import os
 import json
 import argparse
-import re
-import html
-import pandas as pd
-from PIL import Image, ImageDraw, ImageFont
+import shutil
+import hashlib
+import sys
+import glob
+import time
+import functools
+import threading
+import subprocess
+import multiprocessing
+from PIL import Image
+import texty_metrics
+from span_store import open_store, store_path
+from texty_layout import (A4_WIDTH, A4_HEIGHT, FONT_PATH, MIN_FONT_SIZE, MAX_FONT_SIZE, text_words, layout_text,
+                          layout_page, build_page_index, draw_png, draw_mini, save_png, to_palette, write_svg)
 
 # Configuration paths
 CONFIG_PATH = "config.json"
@@ -15,18 +25,59 @@ TEXTY_FOLDER = "texty"
 PNG_FOLDER = os.path.join(TEXTY_FOLDER, "PNG")
 MINI_FOLDER = os.path.join(TEXTY_FOLDER, "PNGmini")
 SVG_FOLDER = os.path.join(TEXTY_FOLDER, "SVG")
+CACHE_FOLDER = os.path.join(TEXTY_FOLDER, "cache")
+CACHE_MANIFEST = os.path.join(CACHE_FOLDER, "manifest.json")
+ATLAS_FOLDER = os.path.join(TEXTY_FOLDER, "atlas")
+PAGES_FOLDER = os.path.join(TEXTY_FOLDER, "pages")
+
+# Sprite sheets: thumbnails per sheet and per row
+ATLAS_SHEET_SIZE = 256
+ATLAS_COLUMNS = 16
+
+# Bump when the rendering code changes so cached images are regenerated
+CACHE_VERSION = 4
+
+# Output kinds that can be selected with --outputs
+OUTPUT_KINDS = ("png", "mini", "svg")
+
+# Jobs handed to the process pool ahead of the results consumed, per worker
+READ_AHEAD_PER_WORKER = 4
+
+# Font size used for documents that are split into pages with --paginate
+PAGE_FONT_SIZE = 14
+
+# --watch: folder polled for JSONL files, seconds between polls, and how long
+# a file must stay unchanged before it is rendered (debounces bursts of writes)
+WATCH_FOLDER = os.path.join("..", "Data")
+POLL_INTERVAL = 1.0
+DEBOUNCE_SECONDS = 2.0
 
 # Ensure output folders exist
-for folder in [PNG_FOLDER, MINI_FOLDER, SVG_FOLDER]:
+for folder in [PNG_FOLDER, MINI_FOLDER, SVG_FOLDER, CACHE_FOLDER, PAGES_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
 def parse_arguments():
     parser = argparse.ArgumentParser(
         description="Generate Texty visualizations from a JSON or JSONL file."
     )
-    parser.add_argument('--data_file', required=True, help="Input file (JSON or JSONL with objects)")
+    parser.add_argument('--data_file', required=False, help="Input file (JSON or JSONL with objects), required unless --watch is used")
     parser.add_argument('--Categories_file', required=False, help="JSON config file with categories")
     parser.add_argument('--output_name', required=False, help="Optional base name (overridden in batch mode)")
+    parser.add_argument('--workers', type=int, default=1, help="Number of worker processes used to render documents (default: 1)")
+    parser.add_argument('--no_cache', action='store_true', help="Re-render every document, ignoring the render cache")
+    parser.add_argument('--atlas', action='store_true', help="Pack all mini PNGs into sprite sheets with a JSON index of offsets")
+    parser.add_argument('--outputs', default=",".join(OUTPUT_KINDS), help="Comma separated outputs to write: png, mini, svg (default: all)")
+    parser.add_argument('--png_palette', action='store_true', help="Write PNGs as indexed images with a palette built from the category colors")
+    parser.add_argument('--compress_level', type=int, choices=range(10), metavar="0-9", help="zlib compression level for PNGs (higher is smaller and slower)")
+    parser.add_argument('--paginate', action='store_true', help="Split documents that do not fit on one page at --page_font_size into pages")
+    parser.add_argument('--page_font_size', type=int, default=PAGE_FONT_SIZE, help=f"Font size of paginated documents (default: {PAGE_FONT_SIZE})")
+    parser.add_argument('--pages', default="1", help="Pages to render with --paginate: comma separated numbers or 'all' (default: 1)")
+    parser.add_argument('--watch', nargs='?', const=WATCH_FOLDER, metavar="FOLDER", help=f"Keep running and re-render the documents that change in the JSONL files of FOLDER (default: {WATCH_FOLDER})")
+    parser.add_argument('--poll_interval', type=float, default=POLL_INTERVAL, help=f"Seconds between two scans of the watched folder (default: {POLL_INTERVAL})")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS, help=f"Seconds a file must stay unchanged before it is rendered (default: {DEBOUNCE_SECONDS})")
+    parser.add_argument('--export', action='store_true', help="With --watch, run data_for_frontend.py --incremental after every update")
+    parser.add_argument('--ids', help="Comma separated ids of the documents to render; they are looked up in the span store of the data file")
+    parser.add_argument('--profile', action='store_true', help="Time every rendering stage and print a summary after the batch")
     return parser.parse_args()
 
 def load_category_colors(config_path):
@@ -34,141 +85,420 @@ def load_category_colors(config_path):
         config = json.load(f)
     return {entry["category"]: entry["color"] for entry in config["categories"]}
 
-def segment_to_words(segments):
-    words = []
-    for segment, color in segments:
-        tokens = re.split(r'(\s+)', segment)
-        for token in tokens:
-            if token.strip():
-                words.append((token, color))
-    return words
-
-def wrap_words(draw, words, max_width, font):
-    lines, line, line_width = [], [], 0
-    space_width = draw.textbbox((0, 0), " ", font=font)[2]
-    for word, color in words:
-        word_width = draw.textbbox((0, 0), word, font=font)[2]
-        if line and line_width + space_width + word_width > max_width:
-            lines.append(line)
-            line, line_width = [(word, color)], word_width
-        else:
-            line.append((word, color))
-            line_width += word_width + (space_width if line else 0)
-    if line:
-        lines.append(line)
-    return lines
-
-def generate_texty_visuals(text_data, output_base, category_colors):
-    text = text_data.get("text", "")
-    labels = sorted(text_data.get("label", []), key=lambda x: x[0])
-
-    segments = []
-    last = 0
-    for start, end, cat in labels:
-        if last < start:
-            segments.append((text[last:start], "#000000"))
-        segments.append((text[start:end], category_colors.get(cat, "#000000")))
-        last = end
-    if last < len(text):
-        segments.append((text[last:], "#000000"))
-
-    words = segment_to_words(segments)
-
-    A4_WIDTH = 800
-    A4_HEIGHT = int(A4_WIDTH * 1.414)
-    font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-
-    dummy_img = Image.new("RGB", (A4_WIDTH, A4_HEIGHT))
-    dummy_draw = ImageDraw.Draw(dummy_img)
-
-    best_font_size = 10
-    for size in range(10, 300):
-        test_font = ImageFont.truetype(font_path, size)
-        lines = wrap_words(dummy_draw, words, A4_WIDTH - 20, test_font)
-        total_height = len(lines) * (test_font.getbbox("A")[3] + 5)
-        if total_height >= A4_HEIGHT - 20:
-            break
-        best_font_size = size
-
-    font = ImageFont.truetype(font_path, best_font_size)
-    img = Image.new("RGB", (A4_WIDTH, A4_HEIGHT), "white")
-    draw = ImageDraw.Draw(img)
-
-    svg_elements = []
-    y = 10
-    space_width = draw.textbbox((0, 0), " ", font=font)[2]
-
-    for line in wrap_words(draw, words, A4_WIDTH - 20, font):
-        x = 10
-        for word, color in line:
-            w = draw.textbbox((0, 0), word, font=font)[2]
-            h = draw.textbbox((0, 0), word, font=font)[3]
-            if color != "#000000":
-                draw.rectangle([x - 2, y - 5, x + w + 2, y + h + 5], fill=color)
-                draw.text((x, y), word, fill=color, font=font)
-            else:
-                draw.text((x, y), word, fill="white", font=font)
-            svg_elements.append({
-                "x": x,
-                "y": y,
-                "width": w,
-                "height": h,
-                "word": word,
-                "color": color
-            })
-            x += w + space_width
-        y += font.getbbox("A")[3] + 5
-
-    # Save PNG
-    png_path = os.path.join(PNG_FOLDER, f"{output_base}.png")
-    img.save(png_path, "PNG")
-
-    # Save mini PNG
-    mini_img = img.resize((int(A4_WIDTH * 0.2), int(A4_HEIGHT * 0.2)), Image.LANCZOS)
-    mini_path = os.path.join(MINI_FOLDER, f"{output_base}-mini.png")
-    mini_img.save(mini_path, "PNG")
-
-    # Save SVG
-    svg = f'<svg xmlns="http://www.w3.org/2000/svg" width="{A4_WIDTH}" height="{A4_HEIGHT}">\n'
-    svg += '<rect width="100%" height="100%" fill="white" />\n'
-    for el in svg_elements:
-        text_y = el["y"] + el["height"]
-        if el["color"] != "#000000":
-            svg += f'<rect x="{el["x"] - 2}" y="{el["y"] - 5}" width="{el["width"] + 4}" height="{el["height"] + 10}" fill="{el["color"]}" />\n'
-            escaped = html.escape(el["word"], quote=True)
-            svg += f'<text x="{el["x"]}" y="{text_y}" fill="{el["color"]}" stroke="{el["color"]}" stroke-width="1" font-size="{best_font_size}" font-family="DejaVu Sans">{escaped}</text>\n'
-
-
-        else:
-            svg += f'<text x="{el["x"]}" y="{text_y}" fill="white" stroke="white" stroke-width="1" font-size="{best_font_size}" font-family="DejaVu Sans">{html.escape(el["word"], quote=True)}</text>\n'
-    svg += "</svg>"
-    svg_path = os.path.join(SVG_FOLDER, f"{output_base}.svg")
-    with open(svg_path, "w") as f:
-        f.write(svg)
-
-    print(f"[✓] Saved: {png_path}, {mini_path}, {svg_path}")
-
-def load_json_objects(data_file_path):
-    return pd.read_json(data_file_path, lines=True)
-    with open(data_file_path, "r") as f:
-        raw = f.read().strip()
+def write_outputs(layout, output_base, category_colors, outputs=OUTPUT_KINDS, png_options=None):
+    """Write the selected outputs for a layout under output_base. Returns their paths."""
+    png_options = png_options or {}
+    palette, compress_level = png_options.get("palette", False), png_options.get("compress_level")
+    paths = []
+    if "png" in outputs:
+        png_path = os.path.join(PNG_FOLDER, f"{output_base}.png")
+        save_png(draw_png(layout), png_path, category_colors.values(), palette, compress_level)
+        paths.append(png_path)
+
+    if "mini" in outputs:
+        mini_path = os.path.join(MINI_FOLDER, f"{output_base}-mini.png")
+        save_png(draw_mini(layout), mini_path, category_colors.values(), palette, compress_level)
+        paths.append(mini_path)
+
+    if "svg" in outputs:
+        svg_path = os.path.join(SVG_FOLDER, f"{output_base}.svg")
+        with open(svg_path, "w") as f:
+            write_svg(f, layout, category_colors)
+        paths.append(svg_path)
+
+    return tuple(paths)
+
+def generate_texty_visuals(text_data, output_base, category_colors, outputs=OUTPUT_KINDS, png_options=None):
+    """Lay out text_data once and write the selected outputs. Returns their paths."""
+    layout = layout_text(text_words(text_data, category_colors))
+    return write_outputs(layout, output_base, category_colors, outputs, png_options)
+
+def render_page(text_data, category_colors, index, page, output_base, outputs=OUTPUT_KINDS, png_options=None):
+    """
+    Render page number page (1-based) of a paginated document from its page
+    index. Only the words on that page are measured and drawn.
+    """
+    layout = layout_page(text_words(text_data, category_colors), index, page)
+    return write_outputs(layout, output_base, category_colors, outputs, png_options)
+
+def parse_pages(spec, page_count):
+    """Turn a --pages value ("all" or "1,3") into the list of existing page numbers."""
+    if spec == "all":
+        return list(range(1, page_count + 1))
+    pages = sorted({int(page) for page in spec.split(",") if page.strip()})
+    return [page for page in pages if 1 <= page <= page_count]
+
+def render_key(text_data, category_colors, png_options=None):
+    """Hash everything that affects the rendered images into a cache key."""
+    payload = json.dumps({
+        "version": CACHE_VERSION,
+        "png": png_options or {},
+        "text": text_data.get("text", ""),
+        "label": [list(label) for label in text_data.get("label", [])],
+        "colors": category_colors,
+        "layout": [A4_WIDTH, A4_HEIGHT, FONT_PATH, MIN_FONT_SIZE, MAX_FONT_SIZE],
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def output_paths(output_base, outputs=OUTPUT_KINDS):
+    paths = {
+        "png": os.path.join(PNG_FOLDER, f"{output_base}.png"),
+        "mini": os.path.join(MINI_FOLDER, f"{output_base}-mini.png"),
+        "svg": os.path.join(SVG_FOLDER, f"{output_base}.svg"),
+    }
+    return tuple(paths[kind] for kind in OUTPUT_KINDS if kind in outputs)
+
+def cache_paths(key, outputs=OUTPUT_KINDS):
+    paths = {
+        "png": os.path.join(CACHE_FOLDER, f"{key}.png"),
+        "mini": os.path.join(CACHE_FOLDER, f"{key}-mini.png"),
+        "svg": os.path.join(CACHE_FOLDER, f"{key}.svg"),
+    }
+    return tuple(paths[kind] for kind in OUTPUT_KINDS if kind in outputs)
+
+def link_file(src, dst):
+    """Hardlink src to dst (copying if links are not supported)."""
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(src, dst)
+
+def load_manifest():
+    if not os.path.isfile(CACHE_MANIFEST):
+        return {"outputs": {}}
+    with open(CACHE_MANIFEST, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp_path = CACHE_MANIFEST + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, CACHE_MANIFEST)
+
+def evict_unreachable(manifest):
+    """Delete cached images whose key is no longer referenced by the manifest."""
+    reachable = {entry["key"] for entry in manifest["outputs"].values()}
+    evicted = 0
+    for filename in os.listdir(CACHE_FOLDER):
+        if filename == os.path.basename(CACHE_MANIFEST):
+            continue
+        if filename[:64] not in reachable:
+            os.remove(os.path.join(CACHE_FOLDER, filename))
+            evicted += 1
+    return evicted
+
+def load_page_index(text_data, category_colors, key, output_base, font_size, use_cache):
+    """Return the page index of a document, from the cache when possible, and publish it to PAGES_FOLDER."""
+    cached = os.path.join(CACHE_FOLDER, f"{key}-{font_size}pt-pages.json")
+    if use_cache and os.path.exists(cached):
+        with open(cached, "r") as f:
+            index = json.load(f)
+    else:
+        index = build_page_index(text_words(text_data, category_colors), font_size)
+        with open(cached, "w") as f:
+            json.dump(index, f)
+    link_file(cached, os.path.join(PAGES_FOLDER, f"{output_base}.json"))
+    return index
+
+def render_pages(text_data, output_base, category_colors, key, index, pages, use_cache, kinds, png_options):
+    """Render (or link from the cache) the requested pages. Returns (paths, cached)."""
+    paths = []
+    all_cached = True
+    for page in parse_pages(pages, index["page_count"]):
+        outputs = output_paths(f"{output_base}-p{page}", kinds)
+        cached = cache_paths(f"{key}-{index['font_size']}pt-p{page}", kinds)
+        paths.extend(outputs)
+        if use_cache and all(os.path.exists(path) for path in cached):
+            for src, dst in zip(cached, outputs):
+                link_file(src, dst)
+            continue
+        all_cached = False
+        for path in outputs:
+            if os.path.exists(path):
+                os.remove(path)
+        render_page(text_data, category_colors, index, page, f"{output_base}-p{page}", kinds, png_options)
+        for src, dst in zip(outputs, cached):
+            link_file(src, dst)
+    return tuple(paths), all_cached
+
+def render_object(job):
+    """
+    Render one (text_data, output_base, category_colors, use_cache, outputs,
+    png_options, pagination) job. pagination is None or (font_size, pages).
+    When an image set with the same cache key exists it is linked into place
+    instead of being rendered again. Errors are caught and returned so that a
+    broken document does not abort the rest of the batch.
+    Returns (output_base, key, paths, cached, error).
+    """
+    text_data, output_base, category_colors, use_cache, kinds, png_options, pagination = job
+    try:
+        key = render_key(text_data, category_colors, png_options)
+        if pagination:
+            font_size, pages = pagination
+            index = load_page_index(text_data, category_colors, key, output_base, font_size, use_cache)
+            if index["paginated"]:
+                paths, cached = render_pages(text_data, output_base, category_colors, key, index,
+                                             pages, use_cache, kinds, png_options)
+                return output_base, key, paths, cached, None
+        outputs = output_paths(output_base, kinds)
+        cached = cache_paths(key, kinds)
+        if use_cache and all(os.path.exists(path) for path in cached):
+            with texty_metrics.timed("cache_link"):
+                for src, dst in zip(cached, outputs):
+                    link_file(src, dst)
+            return output_base, key, outputs, True, None
+
+        # Outputs may be hardlinks to older cache entries, unlink before writing
+        for path in outputs:
+            if os.path.exists(path):
+                os.remove(path)
+        generate_texty_visuals(text_data, output_base, category_colors, kinds, png_options)
+        for src, dst in zip(outputs, cached):
+            link_file(src, dst)
+        return output_base, key, outputs, False, None
+    except Exception as e:
+        return output_base, None, None, False, f"{type(e).__name__}: {e}"
+
+def render_all(jobs, workers=1):
+    """
+    Yield render_object results in input order, using a process pool if
+    workers > 1. Jobs are consumed lazily: at most READ_AHEAD_PER_WORKER
+    jobs per worker are taken ahead of the results yielded so far, and a
+    worker picks up the next job as soon as it is free.
+    """
+    if workers <= 1:
+        for job in jobs:
+            yield render_object(job)
+        return
+    read_ahead = threading.BoundedSemaphore(workers * READ_AHEAD_PER_WORKER)
+    stopped = threading.Event()
+
+    def feed():
+        # Runs in the pool's task handler thread
+        for job in jobs:
+            read_ahead.acquire()
+            if stopped.is_set():
+                return
+            yield job
+
+    # Each worker process keeps its own texty_layout caches, so fonts and words are measured once per worker.
+    # With --profile the workers send back their stage timings with every result.
+    profile = texty_metrics.enabled()
+    function = functools.partial(texty_metrics.call, render_object) if profile else render_object
+    with multiprocessing.Pool(processes=workers, initializer=texty_metrics.enable, initargs=(profile,)) as pool:
         try:
-            parsed = json.loads(raw)
-            if isinstance(parsed, list):
-                return parsed
-        except json.JSONDecodeError:
-            pass
-
-    # Try JSON lines
-    objects = []
-    with open(data_file_path, "r") as f:
-        for i, line in enumerate(f, start=1):
+            for result in pool.imap(function, feed(), chunksize=1):
+                read_ahead.release()
+                if profile:
+                    result, timings = result
+                    texty_metrics.merge(timings)
+                yield result
+        finally:
+            # Unblock feed() if we stop early, the pool waits for its task handler on exit
+            stopped.set()
+            try:
+                read_ahead.release()
+            except ValueError:
+                pass
+
+def build_atlas(mini_folder=MINI_FOLDER, atlas_folder=ATLAS_FOLDER):
+    """
+    Pack the mini PNGs into sprite sheets of ATLAS_SHEET_SIZE thumbnails and
+    write atlas.json mapping each file name to its sheet and pixel offsets.
+    Returns the number of sheets written.
+    """
+    names = sorted(name for name in os.listdir(mini_folder) if name.endswith(".png"))
+    os.makedirs(atlas_folder, exist_ok=True)
+    for name in os.listdir(atlas_folder):
+        if name.startswith("atlas-") and name.endswith(".png"):
+            os.remove(os.path.join(atlas_folder, name))
+    index = {"sheets": [], "images": {}}
+    for sheet_no, start in enumerate(range(0, len(names), ATLAS_SHEET_SIZE)):
+        batch = names[start:start + ATLAS_SHEET_SIZE]
+        images = []
+        for name in batch:
+            with Image.open(os.path.join(mini_folder, name)) as img:
+                images.append(img.convert("RGB"))
+        tile_width = max(img.width for img in images)
+        tile_height = max(img.height for img in images)
+        columns = min(ATLAS_COLUMNS, len(images))
+        rows = -(-len(images) // columns)
+        sheet = Image.new("RGB", (columns * tile_width, rows * tile_height), color="white")
+        for i, (name, img) in enumerate(zip(batch, images)):
+            x, y = (i % columns) * tile_width, (i // columns) * tile_height
+            sheet.paste(img, (x, y))
+            index["images"][name] = {"sheet": sheet_no, "x": x, "y": y, "w": img.width, "h": img.height}
+        sheet_name = f"atlas-{sheet_no}.png"
+        to_palette(sheet).save(os.path.join(atlas_folder, sheet_name), "PNG", optimize=True)
+        index["sheets"].append({"file": sheet_name, "width": sheet.width, "height": sheet.height})
+    with open(os.path.join(atlas_folder, "atlas.json"), "w") as f:
+        json.dump(index, f, indent=1)
+    return len(index["sheets"])
+
+def data_file_store(data_file):
+    """The memory-mapped span store of data_file, built when the file is new or has changed."""
+    store, built = open_store(data_file)
+    if built:
+        print(f"[✓] Built span store {store_path(data_file)} ({len(store)} documents)")
+    return store
+
+def store_positions(store, data_file, ids=None):
+    """Positions in the span store of all documents, or only of those with the given ids."""
+    if not ids:
+        return range(len(store))
+    positions = []
+    for doc_id in ids:
+        position = store.position(doc_id)
+        if position is None:
+            print(f"[!] Document {doc_id} not found in {data_file}")
+            continue
+        positions.append(position)
+    return positions
+
+def render_data_file(data_file, category_colors, kinds, png_options, pagination, args, manifest, changed_only=False, ids=None):
+    """
+    Render the documents of data_file (or only those in ids) and record them
+    in the manifest. With changed_only, documents whose cache key is the one
+    recorded in the manifest (same text, labels, colors and options) are
+    skipped.
+    Returns (output_bases, total, rendered, failures) where output_bases
+    holds every document in the file, rendered or not.
+    """
+    base_filename = os.path.splitext(os.path.basename(data_file))[0]
+    output_bases = []
+    store = data_file_store(data_file)
+    positions = store_positions(store, data_file, ids)
+    # With changed_only the number of documents to render is not known up front
+    progress_total = "" if changed_only else f"/{len(positions)}"
+
+    def jobs():
+        records = (store.record(position) for position in positions)
+        for obj in texty_metrics.timed_iter("load", records):
+            output_base = f"{base_filename}-{obj['id']}"
+            output_bases.append(output_base)
+            if changed_only:
+                entry = manifest["outputs"].get(output_base)
+                unchanged = entry and entry["key"] == render_key(obj, category_colors, png_options)
+                if unchanged and (pagination or all(os.path.exists(path) for path in output_paths(output_base, kinds))):
+                    continue
+            yield obj, output_base, category_colors, not args.no_cache, kinds, png_options, pagination
+
+    failures = 0
+    rendered = 0
+    for rendered, (output_base, key, paths, cached, error) in enumerate(render_all(jobs(), args.workers), start=1):
+        if error:
+            failures += 1
+            print(f"[!] [{rendered}{progress_total}] Failed to render {output_base}: {error}")
+            continue
+        manifest["outputs"][output_base] = {"key": key}
+        status = "Cached" if cached else "Saved"
+        print(f"[✓] [{rendered}{progress_total}] {status}: {', '.join(paths)}")
+    return output_bases, len(output_bases), rendered, failures
+
+def remove_outputs(output_base, manifest):
+    """Delete the images (and pages) of a document that is gone from its data file."""
+    manifest["outputs"].pop(output_base, None)
+    paths = list(output_paths(output_base))
+    paths.append(os.path.join(PAGES_FOLDER, f"{output_base}.json"))
+    for folder, suffix in [(PNG_FOLDER, ".png"), (MINI_FOLDER, "-mini.png"), (SVG_FOLDER, ".svg")]:
+        paths.extend(glob.glob(os.path.join(glob.escape(folder), f"{glob.escape(output_base)}-p[0-9]*{suffix}")))
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+def print_profile():
+    """Print the stage timings collected with --profile and start over."""
+    print("[✓] Time per stage (stages nest: font_fit includes its wrap calls):")
+    print(texty_metrics.summary())
+    texty_metrics.reset()
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def watch(args, config_path, kinds, png_options, pagination):
+    """
+    Poll args.watch for JSONL files and keep their images up to date. A file
+    is processed once it has stayed unchanged for args.debounce seconds; its
+    documents are diffed by id against the manifest, so only documents whose
+    text or labels changed are rendered, and documents that disappeared have
+    their images removed. Editing the config file re-renders everything; it
+    is debounced like the data files, and a config that cannot be loaded
+    (half written, missing) keeps the previous colors. A file that fails to
+    render is reported and retried once it changes again. Runs until
+    interrupted.
+    """
+    print(f"[✓] Watching {args.watch} (Ctrl+C to stop)")
+    documents = {}   # data file -> output bases of its documents at the last pass
+    seen = {}        # path -> signature when the file was last processed
+    changes = {}     # path -> (signature, time it was first seen with it)
+    category_colors = load_category_colors(config_path)
+    seen[config_path] = file_signature(config_path)
+    while True:
+        current = {path: file_signature(path) for path in glob.glob(os.path.join(glob.escape(args.watch), "*.jsonl"))}
+        current[config_path] = file_signature(config_path)
+        now = time.monotonic()
+        for path in set(seen) | set(current):
+            signature = current.get(path)
+            if signature == seen.get(path):
+                changes.pop(path, None)
+            elif path not in changes or changes[path][0] != signature:
+                changes[path] = (signature, now)
+        settled = sorted(path for path, (_, since) in changes.items() if now - since >= args.debounce)
+        if config_path in settled:
+            settled.remove(config_path)
+            seen[config_path] = changes.pop(config_path)[0]
             try:
-                obj = json.loads(line)
-                objects.append(obj)
-            except json.JSONDecodeError:
-                print(f"[!] Skipping invalid JSON object at line {i}")
-    return objects
+                category_colors = load_category_colors(config_path)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"[!] Could not load {config_path} ({type(e).__name__}: {e}), keeping the previous colors")
+            else:
+                print(f"[✓] Reloaded {config_path}")
+                # New colors change every cache key: diff all files again
+                seen = {path: (() if signature and path != config_path else signature) for path, signature in seen.items()}
+        if settled:
+            manifest = load_manifest()
+            for path in settled:
+                signature = changes.pop(path)[0]
+                # A file that failed is only retried once it changes again
+                seen[path] = signature
+                previous = set(documents.get(path, ()))
+                if signature is None:
+                    documents.pop(path, None)
+                    removed = previous
+                    print(f"[✓] {path} was removed")
+                else:
+                    try:
+                        output_bases, total, rendered, failures = render_data_file(
+                            path, category_colors, kinds, png_options, pagination, args, manifest, changed_only=True)
+                    except Exception as e:
+                        print(f"[!] Failed to update {path}: {type(e).__name__}: {e}")
+                        continue
+                    documents[path] = output_bases
+                    removed = previous - set(output_bases)
+                    print(f"[✓] {path}: {rendered} of {total} documents changed" + (f", {failures} failed" if failures else ""))
+                for output_base in sorted(removed):
+                    remove_outputs(output_base, manifest)
+                if removed:
+                    print(f"[✓] Removed the images of {len(removed)} deleted documents")
+            save_manifest(manifest)
+            evict_unreachable(manifest)
+            if args.atlas:
+                build_atlas()
+            if args.profile:
+                print_profile()
+            if args.export:
+                subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_for_frontend.py"), "--incremental"])
+        time.sleep(args.poll_interval)
 
 def main():
     args = parse_arguments()
@@ -179,20 +509,55 @@ def main():
         exit(1)
 
     category_colors = load_category_colors(config_path)
-    base_filename = os.path.splitext(os.path.basename(args.data_file))[0]
+    kinds = tuple(kind.strip() for kind in args.outputs.split(",") if kind.strip())
+    unknown = [kind for kind in kinds if kind not in OUTPUT_KINDS]
+    if unknown or not kinds:
+        print(f"[!] Unknown outputs: {', '.join(unknown) or args.outputs} (choose from {', '.join(OUTPUT_KINDS)})")
+        exit(1)
+    if args.pages != "all" and not all(page.strip().isdigit() for page in args.pages.split(",")):
+        print(f"[!] Invalid --pages value: {args.pages} (use 'all' or comma separated page numbers)")
+        exit(1)
+
+    png_options = {"palette": args.png_palette, "compress_level": args.compress_level}
+    pagination = (args.page_font_size, args.pages) if args.paginate else None
+    texty_metrics.enable(args.profile)
+
+    if args.watch:
+        if not os.path.isdir(args.watch):
+            print(f"[!] Watch folder not found: {args.watch}")
+            exit(1)
+        try:
+            watch(args, config_path, kinds, png_options, pagination)
+        except KeyboardInterrupt:
+            print("[✓] Stopped watching")
+        return
+    if not args.data_file:
+        print("[!] --data_file is required unless --watch is used")
+        exit(1)
+
+    ids = [doc_id.strip() for doc_id in args.ids.split(",") if doc_id.strip()] if args.ids else None
+    manifest = load_manifest()
+    _, total, _, failures = render_data_file(args.data_file, category_colors, kinds, png_options, pagination, args, manifest, ids=ids)
 
-    objects = load_json_objects(args.data_file)
-    if objects.empty:
+    if total == 0:
         print("[!] No valid objects found in input.")
         exit(1)
 
-    for obj in objects.iterrows():
-        obj_id = obj[1].get("id")
-        if not obj_id:
-            print("[!] Skipping object without 'id'")
-            continue
-        output_base = f"{base_filename}-{obj_id}"
-        generate_texty_visuals(obj[1], output_base, category_colors)
+    save_manifest(manifest)
+    evicted = evict_unreachable(manifest)
+    if evicted:
+        print(f"[✓] Evicted {evicted} unreachable cache files from {CACHE_FOLDER}")
+
+    if args.atlas:
+        sheets = build_atlas()
+        print(f"[✓] Packed mini PNGs into {sheets} sprite sheets in {ATLAS_FOLDER}")
+
+    if args.profile:
+        print_profile()
+
+    if failures:
+        print(f"[!] {failures} of {total} documents failed to render.")
+        exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,352 @@
+"""
+Texty layout engine shared by texty_gen_cli.py and the Flask app.
+
+Words are measured once per font size and kept in per-process LRU caches,
+texts are wrapped into justified lines on an A4 page, and the resulting
+layout (one positioned box per word) is drawn by the PNG, thumbnail and SVG
+back ends below.
+"""
+import re
+import html
+from functools import lru_cache
+from PIL import Image, ImageChops, ImageColor, ImageDraw, ImageFont
+from texty_metrics import timed_function
+
+# A4 page (portrait) and margins
+A4_WIDTH = 800
+A4_HEIGHT = int(A4_WIDTH * 1.414)  # ~1131 pixels
+MARGIN = 10
+LINE_SPACING = 5
+
+# Colored boxes extend this far around labelled words
+PADDING_X = 2
+PADDING_Y = 5
+
+# Thumbnail scale
+MINI_SCALE = 0.2
+
+# Font settings
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+MIN_FONT_SIZE = 10
+MAX_FONT_SIZE = 300
+
+# Sizes of the per-process caches
+FONT_CACHE_SIZE = 64
+WORD_CACHE_SIZE = 1 << 18
+
+# Color of words without a label (drawn invisible)
+UNLABELLED = "#000000"
+
+# Shades between each category color and white in the fallback PNG palette
+PALETTE_BLEND_STEPS = 16
+
+# Scratch surface used only for measuring text
+_measure = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+
+# -----------------------------
+# Fonts and metrics
+# -----------------------------
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(size):
+    """Return the TTF font at the given size, loading it only once per process."""
+    return ImageFont.truetype(FONT_PATH, size)
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def font_metrics(size):
+    """Return (space_width, glyph_height, line_height) of the font at size."""
+    font = load_font(size)
+    space = _measure.textbbox((0, 0), " ", font=font)
+    glyph = _measure.textbbox((0, 0), "A", font=font)
+    glyph_height = glyph[3] - glyph[1]
+    return space[2] - space[0], glyph_height, glyph_height + LINE_SPACING
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def word_box(size, word):
+    """Bounding box of word drawn at the origin at the given size."""
+    return _measure.textbbox((0, 0), word, font=load_font(size))
+
+
+# -----------------------------
+# Words and wrapping
+# -----------------------------
+def segment_to_words(segments):
+    """Convert segments (text, color) into a list of (word, color) tuples."""
+    words = []
+    for segment, color in segments:
+        for token in re.split(r'(\s+)', segment):
+            if token.strip():
+                words.append((token, color))
+    return words
+
+def text_words(text_data, category_colors):
+    """Split a {text, label} record into (word, color) tuples, colored by label category."""
+    text = text_data.get("text", "")
+    labels = sorted(text_data.get("label", []), key=lambda x: x[0])
+    segments = []
+    last = 0
+    for start, end, cat in labels:
+        if last < start:
+            segments.append((text[last:start], UNLABELLED))
+        segments.append((text[start:end], category_colors.get(cat, UNLABELLED)))
+        last = end
+    if last < len(text):
+        segments.append((text[last:], UNLABELLED))
+    return segment_to_words(segments)
+
+@timed_function("wrap")
+def wrap_words(words, size, max_width=A4_WIDTH - 2 * MARGIN):
+    """Wrap words into lines that do not exceed max_width at the given font size."""
+    space_width = font_metrics(size)[0]
+    lines = []
+    line = []
+    line_width = 0
+    for word, color in words:
+        box = word_box(size, word)
+        word_width = box[2] - box[0]
+        if line and line_width + space_width + word_width > max_width:
+            lines.append(line)
+            line, line_width = [], 0
+        line_width += word_width + (space_width if line else 0)
+        line.append((word, color))
+    if line:
+        lines.append(line)
+    return lines
+
+@timed_function("font_fit")
+def find_best_font_size(words, max_width=A4_WIDTH - 2 * MARGIN, max_height=A4_HEIGHT - 2 * MARGIN):
+    """
+    Find the largest font size whose wrapped text fits in max_height.
+    Sizes are probed in doubling steps and then bisected, so only a handful of
+    wraps are needed instead of one per size. Returns the size and its lines.
+    """
+    wrapped = {}
+
+    def fits(size):
+        wrapped[size] = wrap_words(words, size, max_width)
+        return len(wrapped[size]) * font_metrics(size)[2] + 2 * MARGIN <= max_height
+
+    if not fits(MIN_FONT_SIZE):
+        return MIN_FONT_SIZE, wrapped[MIN_FONT_SIZE]
+
+    # Gallop upwards until a size no longer fits (or the limit is reached)
+    low, step, high = MIN_FONT_SIZE, 1, None
+    while low < MAX_FONT_SIZE - 1:
+        candidate = min(low + step, MAX_FONT_SIZE - 1)
+        if not fits(candidate):
+            high = candidate
+            break
+        low, step = candidate, step * 2
+    if high is None:
+        return low, wrapped[low]
+
+    # Bisect between the last size that fits and the first that does not
+    while high - low > 1:
+        mid = (low + high) // 2
+        if fits(mid):
+            low = mid
+        else:
+            high = mid
+    return low, wrapped[low]
+
+
+# -----------------------------
+# Layout
+# -----------------------------
+@timed_function("layout")
+def layout_lines(lines, size, ends_text=True, max_width=A4_WIDTH - 2 * MARGIN):
+    """
+    Position wrapped lines on a page. Every line is justified to max_width
+    except the last one when it ends the text. Returns the layout:
+    {"font_size", "words": [{x, y, width, height, box_height, word, color}]}
+    where height is the glyph height of the font and box_height the height
+    of the word's own bounding box.
+    """
+    space_width, glyph_height, line_height = font_metrics(size)
+    words = []
+    y = MARGIN
+    for i, line in enumerate(lines):
+        boxes = [word_box(size, word) for word, _ in line]
+        widths = [box[2] - box[0] for box in boxes]
+        added_space = 0
+        if ends_text and i == len(lines) - 1:
+            pass
+        elif len(line) > 1:
+            extra_space = max_width - sum(widths) - (len(line) - 1) * space_width
+            added_space = extra_space / (len(line) - 1) if extra_space > 0 else 0
+        x = MARGIN
+        for (word, color), box, width in zip(line, boxes, widths):
+            words.append({
+                "x": x,
+                "y": y,
+                "width": width,
+                "height": glyph_height,
+                "box_height": box[3] - box[1],
+                "word": word,
+                "color": color
+            })
+            x += width + space_width + added_space
+        y += line_height
+    return {"font_size": size, "words": words}
+
+def layout_text(words):
+    """Lay out words at the largest font size that fits on one page."""
+    size, lines = find_best_font_size(words)
+    return layout_lines(lines, size)
+
+def build_page_index(words, size, max_width=A4_WIDTH - 2 * MARGIN, max_height=A4_HEIGHT - 2 * MARGIN):
+    """
+    Wrap words once at size and split the lines into pages. Returns the page
+    index: the index of the first word of every line and the number of lines
+    per page. "paginated" is False when everything fits on one page.
+    """
+    lines = wrap_words(words, size, max_width)
+    lines_per_page = max(1, (max_height - 2 * MARGIN) // font_metrics(size)[2])
+    line_starts = []
+    start = 0
+    for line in lines:
+        line_starts.append(start)
+        start += len(line)
+    page_count = max(1, -(-len(lines) // lines_per_page))
+    return {
+        "paginated": page_count > 1,
+        "font_size": size,
+        "page_count": page_count,
+        "lines_per_page": lines_per_page,
+        "word_count": len(words),
+        "line_starts": line_starts,
+    }
+
+def layout_page(words, index, page):
+    """Lay out page number page (1-based) of a page index; only its words are measured."""
+    starts = index["line_starts"] + [index["word_count"]]
+    first = (page - 1) * index["lines_per_page"]
+    last = min(first + index["lines_per_page"], len(index["line_starts"]))
+    lines = [words[starts[i]:starts[i + 1]] for i in range(first, last)]
+    return layout_lines(lines, index["font_size"], ends_text=last == len(index["line_starts"]))
+
+
+# -----------------------------
+# PNG and thumbnail back ends
+# -----------------------------
+@timed_function("draw_png")
+def draw_png(layout):
+    """Draw a layout on a full size page."""
+    font = load_font(layout["font_size"])
+    img = Image.new("RGB", (A4_WIDTH, A4_HEIGHT), color="white")
+    draw = ImageDraw.Draw(img)
+    for el in layout["words"]:
+        x, y, word, color = el["x"], el["y"], el["word"], el["color"]
+        if color == UNLABELLED:
+            # Un-categorized: draw invisible (white fill and stroke)
+            draw.text((x, y), word, fill="white", font=font, stroke_width=1, stroke_fill="white")
+        else:
+            draw.rectangle([x - PADDING_X, y - PADDING_Y, x + el["width"] + PADDING_X, y + el["box_height"] + PADDING_Y], fill=color)
+            draw.text((x, y), word, fill=color, font=font, stroke_width=1, stroke_fill=color)
+    return img
+
+@timed_function("draw_mini")
+def draw_mini(layout):
+    """
+    Draw the thumbnail directly at MINI_SCALE. At that size a labelled word
+    is just its colored box and unlabelled words are invisible, so only the
+    boxes are drawn and no full size page is needed.
+    """
+    width, height = int(A4_WIDTH * MINI_SCALE), int(A4_HEIGHT * MINI_SCALE)
+    sx, sy = width / A4_WIDTH, height / A4_HEIGHT
+    img = Image.new("RGB", (width, height), color="white")
+    draw = ImageDraw.Draw(img)
+    for el in layout["words"]:
+        if el["color"] != UNLABELLED:
+            x, y = el["x"], el["y"]
+            draw.rectangle([(x - PADDING_X) * sx, (y - PADDING_Y) * sy,
+                            (x + el["width"] + PADDING_X) * sx, (y + el["box_height"] + PADDING_Y) * sy],
+                           fill=el["color"])
+    return img
+
+def category_palette(colors):
+    """White, black and the category colors, each blended towards white in PALETTE_BLEND_STEPS shades."""
+    base = [(255, 255, 255), (0, 0, 0)] + [ImageColor.getrgb(color)[:3] for color in dict.fromkeys(colors)]
+    entries = list(base)
+    for rgb in base[2:]:
+        for step in range(1, PALETTE_BLEND_STEPS):
+            t = step / PALETTE_BLEND_STEPS
+            entries.append(tuple(round(c + (255 - c) * t) for c in rgb))
+    return list(dict.fromkeys(entries))[:256]
+
+def to_palette(img, colors=None):
+    """
+    Convert an RGB image to palette mode. With at most 256 colors the palette
+    holds exactly the colors of the image, so no pixel changes. Otherwise
+    pixels are mapped to the nearest entry of category_palette(colors), which
+    covers anti-aliased edges; without colors the image is returned unchanged.
+    """
+    found = img.getcolors(256)
+    if found is not None:
+        # Median cut with one box per color reproduces the image exactly, keep RGB if it ever does not
+        indexed = img.quantize(colors=len(found), method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        if ImageChops.difference(img, indexed.convert("RGB")).getbbox() is None:
+            return indexed
+        return img
+    if colors is None:
+        return img
+    entries = category_palette(colors)
+    flat = [channel for rgb in entries for channel in rgb]
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(flat + flat[:3] * (256 - len(entries)))
+    return img.quantize(palette=palette, dither=Image.Dither.NONE)
+
+@timed_function("png_write")
+def save_png(img, path, colors=None, palette=False, compress_level=None):
+    """Save img as PNG, optionally as an indexed image (see to_palette) and with a zlib level."""
+    if palette:
+        img = to_palette(img, colors)
+    params = {}
+    if compress_level is not None:
+        params["compress_level"] = compress_level
+    img.save(path, "PNG", **params)
+
+
+# -----------------------------
+# SVG back end
+# -----------------------------
+def svg_number(value):
+    """Format a coordinate with at most one decimal."""
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
+def svg_classes(category_colors):
+    """Map each category color to a CSS class name."""
+    classes = {}
+    for category, color in category_colors.items():
+        if color not in classes:
+            classes[color] = "c-" + re.sub(r"[^A-Za-z0-9_-]", "_", category)
+    return classes
+
+@timed_function("svg")
+def write_svg(out, layout, category_colors):
+    """
+    Write the SVG for a layout to the file-like object out, one element at a
+    time. Shared styling lives in a <style> block with one class per
+    category; unlabelled words use the default white text style and text
+    strokes follow the class color through currentColor.
+    """
+    classes = svg_classes(category_colors)
+    out.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{A4_WIDTH}" height="{A4_HEIGHT}">')
+    out.write(f"<style>text{{font:{layout['font_size']}px 'DejaVu Sans';fill:#fff;color:#fff;stroke:currentColor;stroke-width:1}}")
+    for color, name in classes.items():
+        out.write(f".{name}{{fill:{color};color:{color}}}")
+    out.write('</style><rect width="100%" height="100%" fill="#fff"/>\n')
+    for el in layout["words"]:
+        x, y, w, h = el["x"], el["y"], el["width"], el["height"]
+        word = html.escape(el["word"], quote=True)
+        text_y = y + h  # adjust for baseline
+        if el["color"] == UNLABELLED:
+            out.write(f'<text x="{svg_number(x)}" y="{svg_number(text_y)}">{word}</text>\n')
+        else:
+            name = classes[el["color"]]
+            out.write(
+                f'<rect class="{name}" x="{svg_number(x - PADDING_X)}" y="{svg_number(y - PADDING_Y)}" '
+                f'width="{svg_number(w + 2 * PADDING_X)}" height="{svg_number(h + 2 * PADDING_Y)}"/>'
+                f'<text class="{name}" x="{svg_number(x)}" y="{svg_number(text_y)}">{word}</text>\n'
+            )
+    out.write('</svg>')
@@ -0,0 +1,132 @@
+"""
+Optional timing of the rendering stages, shared by texty_gen_cli.py and the
+Flask app. Nothing is recorded until enable() is called, so the hooks cost
+one flag check when instrumentation is off.
+
+Durations are kept per (family, name): "stage" for the pipeline stages
+(load, font_fit, wrap, ...) and "endpoint" for Flask requests. Stages can
+nest: font_fit includes the wrap_words calls of the font size search.
+"""
+import time
+import threading
+import functools
+import contextlib
+
+_enabled = False
+_lock = threading.Lock()
+# (family, name) -> [count, total seconds, max seconds]
+_timings = {}
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+def enabled():
+    return _enabled
+
+def record(name, seconds, family="stage"):
+    """Add one duration to the totals of name."""
+    with _lock:
+        entry = _timings.get((family, name))
+        if entry is None:
+            _timings[(family, name)] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+@contextlib.contextmanager
+def timed(name, family="stage"):
+    """Time the body of a with block as one call of name."""
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start, family)
+
+def timed_function(name):
+    """Decorator recording every call of the function as the stage name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def timed_iter(name, iterable):
+    """Yield from iterable, recording the time spent producing each item as the stage name."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        if _enabled:
+            record(name, time.perf_counter() - start)
+        yield item
+
+def snapshot():
+    """Current totals as a list of [family, name, count, seconds, max_seconds]."""
+    with _lock:
+        return [[family, name] + list(entry) for (family, name), entry in sorted(_timings.items())]
+
+def merge(timings):
+    """Add totals taken with snapshot() in another process."""
+    with _lock:
+        for family, name, count, seconds, max_seconds in timings:
+            entry = _timings.setdefault((family, name), [0, 0.0, 0.0])
+            entry[0] += count
+            entry[1] += seconds
+            entry[2] = max(entry[2], max_seconds)
+
+def reset():
+    with _lock:
+        _timings.clear()
+
+def call(function, *args):
+    """
+    Run function(*args) in a worker process and return (result, timings)
+    with the timings recorded during the call, to be merged into the
+    parent process with merge().
+    """
+    reset()
+    return function(*args), snapshot()
+
+def prometheus(prefix="texty"):
+    """Totals in the Prometheus text exposition format."""
+    help_text = {"stage": "Time spent in each rendering stage.", "endpoint": "Time spent handling requests per endpoint."}
+    labels = {"stage": "stage", "endpoint": "endpoint"}
+    out = []
+    timings = snapshot()
+    for family in sorted({row[0] for row in timings}):
+        metric = f"{prefix}_{family}_seconds"
+        out.append(f"# HELP {metric} {help_text.get(family, '')}".rstrip())
+        out.append(f"# TYPE {metric} summary")
+        rows = [row for row in timings if row[0] == family]
+        for _, name, count, seconds, _ in rows:
+            label = f'{labels.get(family, "name")}="{name}"'
+            out.append(f"{metric}_sum{{{label}}} {seconds:.6f}")
+            out.append(f"{metric}_count{{{label}}} {count}")
+        out.append(f"# HELP {metric}_max Longest single call.")
+        out.append(f"# TYPE {metric}_max gauge")
+        for _, name, _, _, max_seconds in rows:
+            out.append(f'{metric}_max{{{labels.get(family, "name")}="{name}"}} {max_seconds:.6f}')
+    return "\n".join(out) + "\n"
+
+def summary(family="stage"):
+    """A table of the totals of one family, slowest first, for printing."""
+    rows = sorted((row for row in snapshot() if row[0] == family), key=lambda row: -row[3])
+    lines = [f"{'stage':<14} {'calls':>8} {'total s':>10} {'mean ms':>10} {'max ms':>10}"]
+    for _, name, count, seconds, max_seconds in rows:
+        lines.append(f"{name:<14} {count:>8} {seconds:>10.3f} {seconds / count * 1000:>10.2f} {max_seconds * 1000:>10.2f}")
+    return "\n".join(lines)
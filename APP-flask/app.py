@@ -1,11 +1,57 @@
 import os
+import sys
 import json
 import re
-from flask import Flask, jsonify, request, abort, render_template, send_from_directory
-from PIL import Image, ImageDraw, ImageFont
+import io
+import gzip
+import shutil
+import time
+import hashlib
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from flask import Flask, Response, g, jsonify, request, abort, render_template, send_from_directory, stream_with_context
+from werkzeug.utils import safe_join
+from PIL import Image
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The layout engine is shared with the command line tool in ../APP-cli
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "APP-cli"))
+import texty_layout
+import texty_metrics
+import record_index
+import span_search
+import span_store
+from texty_layout import A4_WIDTH, A4_HEIGHT, FONT_PATH, MIN_FONT_SIZE, MAX_FONT_SIZE
 
 app = Flask(__name__)
 
+# TEXTY_METRICS=1 times the rendering stages and every request, see /api/metrics
+METRICS = os.environ.get("TEXTY_METRICS", "0") not in ("0", "", "false")
+texty_metrics.enable(METRICS)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    # Recorded when the response is closed, so streamed responses count until their last line.
+    # Files are passed straight to the server, which never closes the response: record those now.
+    if texty_metrics.enabled() and request.endpoint:
+        endpoint, start = request.endpoint, g.request_start
+        done = lambda: texty_metrics.record(endpoint, time.perf_counter() - start, family="endpoint")
+        if response.direct_passthrough:
+            done()
+        else:
+            response.call_on_close(done)
+    return response
+
 # Route to frontend
 @app.route('/')
 def index():
@@ -13,287 +59,980 @@ def index():
 
 @app.route('/texty/<path:filename>')
 def serve_texty(filename):
+    """
+    Serve a rendered file. SVGs are sent precompressed (brotli or gzip) when
+    the client accepts it. Content-addressed files in cache/ never change and
+    are marked immutable; everything else is revalidated through its ETag.
+    """
     directory = os.path.join(app.root_path, 'texty')
-    return send_from_directory(directory, filename)
+    immutable = IMMUTABLE_NAME.match(filename) is not None
+    sent_name, encoding = filename, None
+    if filename.endswith(".svg"):
+        for accepted, suffix in PRECOMPRESSED_SVG:
+            path = safe_join(directory, filename + suffix)
+            if accepted in request.accept_encodings and path and os.path.isfile(path):
+                sent_name, encoding = filename + suffix, accepted
+                break
+    # A content-hashed name makes a strong ETag (one per encoding)
+    etag = os.path.basename(sent_name) if immutable else True
+    response = send_from_directory(directory, sent_name, etag=etag,
+                                   mimetype="image/svg+xml" if encoding else None,
+                                   download_name=os.path.basename(filename))
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if filename.endswith(".svg"):
+        response.vary.add("Accept-Encoding")
+    if immutable:
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    else:
+        response.headers["Cache-Control"] = "no-cache"
+    return response
 
 # Define paths
 CONFIG_PATH = "config.json"
 TEXTS_FOLDER = "texts"
+# JSONL corpora read by id through a byte-offset index (see /api/documents)
+DATA_FOLDER = os.environ.get("TEXTY_DATA_FOLDER", os.path.join(os.pardir, "Data"))
+# Inverted index written by APP-cli/data_for_frontend.py
+SEARCH_INDEX_PATH = os.environ.get("TEXTY_SEARCH_INDEX", os.path.join(os.pardir, "impersonal-frontend", "public", span_search.SEARCH_INDEX_NAME))
+SEARCH_PAGE_SIZE = 50
 TEXTY_FOLDER = "texty"
-os.makedirs(TEXTY_FOLDER, exist_ok=True)
+CACHE_FOLDER = os.path.join(TEXTY_FOLDER, "cache")
+CACHE_MANIFEST = os.path.join(CACHE_FOLDER, "manifest.json")
+PAGES_FOLDER = os.path.join(TEXTY_FOLDER, "pages")
+os.makedirs(CACHE_FOLDER, exist_ok=True)
+os.makedirs(PAGES_FOLDER, exist_ok=True)
+
+# Bump when the rendering code changes so cached images are regenerated
+CACHE_VERSION = 3
+
+# Files written per render; SVGs get precompressed siblings (brotli only if installed)
+PRECOMPRESSED_SVG = ([("br", ".br")] if brotli else []) + [("gzip", ".gz")]
+OUTPUT_SUFFIXES = [".png", "-mini.png", ".svg"] + [".svg" + suffix for _, suffix in PRECOMPRESSED_SVG]
+# Cache files and atlas sheets are named after their content, so their URLs can be cached forever
+IMMUTABLE_NAME = re.compile(r"^(cache/[0-9a-f]{64}(-\d+pt-p\d+)?(\.png|-mini\.png|\.svg)|atlas/[0-9a-f]{64}\.png)$")
+
+# Sprite sheets of mini PNGs for the gallery: thumbnails per sheet and per row
+ATLAS_FOLDER = os.path.join(TEXTY_FOLDER, "atlas")
+ATLAS_SHEET_SIZE = 256
+ATLAS_COLUMNS = 16
+manifest_lock = threading.Lock()
+
+# Background rendering: size of the process pool and how long finished jobs are kept
+RENDER_WORKERS = int(os.environ.get("TEXTY_RENDER_WORKERS", os.cpu_count() or 1))
+JOB_TTL = 3600
+# Batch renders are split into chunks of at most this many texts per worker task
+BATCH_CHUNK_SIZE = 16
+render_executor = None
+executor_lock = threading.Lock()
+render_jobs = {}
+# Cache key -> number of jobs, batches and page renders still writing it
+pending_keys = Counter()
+jobs_lock = threading.Lock()
+
+# PNG encoding: TEXTY_PNG_PALETTE=1 writes indexed PNGs with a palette built
+# from the category colors, TEXTY_PNG_COMPRESS_LEVEL (0-9) sets the zlib level
+PNG_PALETTE = os.environ.get("TEXTY_PNG_PALETTE", "0") not in ("0", "", "false")
+PNG_COMPRESS_LEVEL = int(os.environ["TEXTY_PNG_COMPRESS_LEVEL"]) if os.environ.get("TEXTY_PNG_COMPRESS_LEVEL") else None
+
+# Texts too long for one page at this size are split into pages (see /api/texty_pages)
+PAGE_FONT_SIZE = 14
 
 # Load configuration and create lookup for category colors
-with open(CONFIG_PATH, "r") as f:
-    config = json.load(f)
-categories_colors = {cat["category"]: cat["color"] for cat in config["categories"]}
+config = None
+categories_colors = {}
+config_mtime = None
+
+def refresh_config():
+    """(Re)load config.json when it has changed, so color edits apply without a restart."""
+    global config, categories_colors, config_mtime
+    mtime = os.stat(CONFIG_PATH).st_mtime_ns
+    if mtime != config_mtime:
+        with open(CONFIG_PATH, "r") as f:
+            config = json.load(f)
+        categories_colors = {cat["category"]: cat["color"] for cat in config["categories"]}
+        config_mtime = mtime
+
+refresh_config()
 
 # -----------------------------
-# Helper functions for wrapping and justification
+# Render cache
 # -----------------------------
-def segment_to_words(segments):
-    """Convert segments (text, color) into a list of (word, color) tuples."""
-    words = []
-    for segment, color in segments:
-        tokens = re.split(r'(\s+)', segment)
-        for token in tokens:
-            if token.strip() == "":
-                continue
-            words.append((token, color))
-    return words
-
-def wrap_words(draw, words, max_width, font):
-    """Wrap words into lines that do not exceed max_width."""
-    lines = []
-    current_line = []
-    current_width = 0
-    space_bbox = draw.textbbox((0, 0), " ", font=font)
-    space_width = space_bbox[2] - space_bbox[0]
-    for word, color in words:
-        word_bbox = draw.textbbox((0, 0), word, font=font)
-        word_width = word_bbox[2] - word_bbox[0]
-        if current_line:
-            if current_width + space_width + word_width <= max_width:
-                current_line.append((word, color))
-                current_width += space_width + word_width
-            else:
-                lines.append(current_line)
-                current_line = [(word, color)]
-                current_width = word_width
-        else:
-            current_line.append((word, color))
-            current_width = word_width
-    if current_line:
-        lines.append(current_line)
-    return lines
-
-def justify_line_positions(draw, line, x, y, max_width, font):
-    """
-    Given a line (list of (word, color)), compute the x positions for each word
-    so that the line is justified. Returns a list of dictionaries with word info.
-    """
-    word_widths = []
-    for word, _ in line:
-        bbox = draw.textbbox((0, 0), word, font=font)
-        word_widths.append(bbox[2] - bbox[0])
-    total_words_width = sum(word_widths)
-    space_bbox = draw.textbbox((0, 0), " ", font=font)
-    space_width = space_bbox[2] - space_bbox[0]
-    num_spaces = len(line) - 1
-    if num_spaces > 0:
-        extra_space = max_width - total_words_width - (num_spaces * space_width)
-        added_space = extra_space / num_spaces if extra_space > 0 else 0
+def write_precompressed(path):
+    """Write .gz (and .br when brotli is installed) siblings of path for static serving."""
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path + ".gz", "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli:
+        with open(path + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=11))
+
+def render_key(text_data):
+    """Hash everything that affects the rendered images into a cache key."""
+    payload = json.dumps({
+        "version": CACHE_VERSION,
+        "text": text_data.get("text", ""),
+        "label": text_data.get("label", []),
+        "colors": categories_colors,
+        "layout": [A4_WIDTH, A4_HEIGHT, FONT_PATH, MIN_FONT_SIZE, MAX_FONT_SIZE],
+        "png": [PNG_PALETTE, PNG_COMPRESS_LEVEL],
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def link_file(src, dst):
+    """Hardlink src to dst (copying if links are not supported)."""
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(src, dst)
+
+def load_manifest():
+    if not os.path.isfile(CACHE_MANIFEST):
+        return {"outputs": {}}
+    with open(CACHE_MANIFEST, "r") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    tmp_path = f"{CACHE_MANIFEST}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, CACHE_MANIFEST)
+
+def evict_unreachable(manifest):
+    """Delete cached images whose key is neither in the manifest nor being rendered."""
+    reachable = {entry["key"] for entry in manifest["outputs"].values()}
+    reachable |= set(manifest.get("pages", {}).values())
+    with jobs_lock:
+        reachable |= {key for key, count in pending_keys.items() if count > 0}
+    for name in os.listdir(CACHE_FOLDER):
+        if any(name.endswith(suffix) for suffix in OUTPUT_SUFFIXES + ["-pages.json"]):
+            if name[:64] not in reachable:
+                os.remove(os.path.join(CACHE_FOLDER, name))
+
+def release_keys(keys):
+    """Drop one hold on each key of a finished render (call with jobs_lock held)."""
+    pending_keys.subtract(keys)
+    for key in keys:
+        if key in pending_keys and pending_keys[key] <= 0:
+            del pending_keys[key]
+
+def lookup_render(base_name, key):
+    """
+    Check the manifest for a render of key. Returns (font_size, fresh) where
+    fresh means the outputs for base_name are already up to date, or
+    (None, False) when the text has never been rendered with this key.
+    """
+    outputs = [os.path.join(TEXTY_FOLDER, base_name + suffix) for suffix in OUTPUT_SUFFIXES]
+    with manifest_lock:
+        manifest = load_manifest()
+    entry = manifest["outputs"].get(base_name)
+    if entry and entry["key"] == key and all(os.path.exists(path) for path in outputs):
+        return entry["font_size"], True
+    for entry in manifest["outputs"].values():
+        if entry["key"] == key:
+            return entry["font_size"], False
+    return None, False
+
+def render_job(text_data, base_name, key, known_font_size=None):
+    """
+    Produce the images for base_name: link an identical render from the cache
+    when known_font_size says one exists, otherwise render and add it to the
+    cache. Runs in the render process pool. Returns (font_size, cached).
+    """
+    refresh_config()
+    outputs = [os.path.join(TEXTY_FOLDER, base_name + suffix) for suffix in OUTPUT_SUFFIXES]
+    cached = [os.path.join(CACHE_FOLDER, key + suffix) for suffix in OUTPUT_SUFFIXES]
+    if known_font_size is not None and all(os.path.exists(path) for path in cached):
+        with texty_metrics.timed("cache_link"):
+            for src, dst in zip(cached, outputs):
+                link_file(src, dst)
+        return known_font_size, True
+    # Outputs may be hardlinks to older cache entries, unlink before writing
+    for path in outputs:
+        if os.path.exists(path):
+            os.remove(path)
+    best_font_size = render_texty(text_data, base_name)
+    for src, dst in zip(outputs, cached):
+        link_file(src, dst)
+    return best_font_size, False
+
+def record_render(base_name, key, font_size):
+    """Store a finished render in the manifest and evict entries that became unreachable."""
+    record_renders([(base_name, key, font_size)])
+
+def record_renders(renders):
+    """Store several (base_name, key, font_size) renders with a single manifest write."""
+    with manifest_lock:
+        manifest = load_manifest()
+        for base_name, key, font_size in renders:
+            manifest["outputs"][base_name] = {"key": key, "font_size": font_size}
+        save_manifest(manifest)
+        evict_unreachable(manifest)
+
+def cached_render(text_data, base_name, key):
+    """
+    Produce the images for base_name in the calling thread. Up-to-date
+    outputs are left alone, an identical render found in the cache is linked
+    into place, and anything else is rendered and added to the cache.
+    Returns (font_size, cached).
+    """
+    font_size, fresh = lookup_render(base_name, key)
+    if fresh:
+        return font_size, True
+    # Hold the key so a concurrent eviction keeps its cache files until it is in the manifest
+    with jobs_lock:
+        pending_keys[key] += 1
+    try:
+        font_size, cached = render_job(text_data, base_name, key, font_size)
+        record_render(base_name, key, font_size)
+    finally:
+        with jobs_lock:
+            release_keys([key])
+    return font_size, cached
+
+def render_batch(items):
+    """
+    Render a chunk of (text_data, base_name, key, known_font_size) items in
+    one worker task, rendering texts with the same key only once. Measured
+    word widths are shared through the worker's layout caches.
+    Returns (base_name, font_size, cached, error) for each item.
+    """
+    rendered = {}
+    results = []
+    for text_data, base_name, key, known_font_size in items:
+        try:
+            known_font_size = rendered.get(key, known_font_size)
+            font_size, cached = render_job(text_data, base_name, key, known_font_size)
+            rendered[key] = font_size
+            results.append((base_name, font_size, cached, None))
+        except Exception as e:
+            results.append((base_name, None, False, str(e)))
+    return results
+
+def render_result(base_name, key, font_size, cached):
+    return {
+        "message": "Texty image generated successfully.",
+        "png_file": base_name + ".png",
+        "mini_png_file": base_name + "-mini.png",
+        "svg_file": base_name + ".svg",
+        # Content-addressed copies, served with immutable cache headers
+        "png_url": f"/texty/cache/{key}.png",
+        "mini_png_url": f"/texty/cache/{key}-mini.png",
+        "svg_url": f"/texty/cache/{key}.svg",
+        "font_size": font_size,
+        "cached": cached
+    }
+
+# -----------------------------
+# Background render jobs
+# -----------------------------
+def get_render_executor():
+    global render_executor
+    with executor_lock:
+        if render_executor is None:
+            render_executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        return render_executor
+
+def submit_to_pool(function, *args):
+    """
+    Submit a task to the render pool. A pool is broken for good once one of
+    its workers dies (e.g. killed for memory), so it is replaced by a new one
+    and the task is submitted again.
+    """
+    global render_executor
+    executor = get_render_executor()
+    try:
+        return executor.submit(function, *args)
+    except BrokenProcessPool:
+        print("[!] Render pool is broken (a worker died), starting a new one")
+        with executor_lock:
+            if render_executor is executor:
+                render_executor = None
+        executor.shutdown(wait=False)
+        return get_render_executor().submit(function, *args)
+
+def job_status(job):
+    """Public view of a render job."""
+    status = {"job_id": job["id"], "filename": job["filename"]}
+    future = job["future"]
+    if not future.done():
+        status["status"] = "running" if future.running() else "queued"
+    elif future.exception() is not None:
+        status["status"] = "failed"
+        status["error"] = str(future.exception())
     else:
-        added_space = 0
-    positions = []
-    cur_x = x
-    for (word, color), w in zip(line, word_widths):
-        positions.append({
-            "x": cur_x,
-            "y": y,
-            "word": word,
-            "color": color,
-            "width": w,
-            "height": (draw.textbbox((0, 0), "A", font=font)[3] - draw.textbbox((0, 0), "A", font=font)[1])
-        })
-        cur_x += w + space_width + added_space
-    return positions
+        status["status"] = "done"
+        status.update(render_result(job["base_name"], job["key"], *future.result()[0]))
+    return status
+
+def finish_job(job):
+    """
+    Record a finished job's render in the manifest (runs when its future
+    completes). The key is only released once it is in the manifest.
+    """
+    future = job["future"]
+    try:
+        if future.exception() is None:
+            (font_size, _), timings = future.result()
+            texty_metrics.merge(timings)
+            record_render(job["base_name"], job["key"], font_size)
+    finally:
+        with jobs_lock:
+            release_keys([job["key"]])
+            job["finished"] = time.time()
+
+def submit_render(text_data, filename, key, known_font_size):
+    """
+    Queue a render in the process pool and return its job. The job id is
+    derived from the file and its cache key, so repeated submissions of the
+    same unchanged file are merged into the job already queued or running.
+    """
+    base_name = os.path.splitext(filename)[0]
+    job_id = f"{base_name}-{key[:16]}"
+    with jobs_lock:
+        # Forget finished jobs that are older than JOB_TTL
+        now = time.time()
+        for old_id in [i for i, job in render_jobs.items() if now - job.get("finished", now) > JOB_TTL]:
+            del render_jobs[old_id]
+        job = render_jobs.get(job_id)
+        if job is not None and not job["future"].done():
+            return job
+        # Workers send back their stage timings with the result
+        future = submit_to_pool(texty_metrics.call, render_job, text_data, base_name, key, known_font_size)
+        job = {"id": job_id, "filename": filename, "base_name": base_name, "key": key, "future": future}
+        render_jobs[job_id] = job
+        pending_keys[key] += 1
+    future.add_done_callback(lambda _: finish_job(job))
+    return job
 
 # -----------------------------
 # /api/texty_gen Endpoint
 # -----------------------------
 @app.route("/api/texty_gen", methods=["POST"])
 def texty_gen():
+    """
+    Generate the Texty images for a text file, or for document "id" of the
+    JSONL file "data_file" in DATA_FOLDER. Up-to-date images are returned at
+    once; otherwise the render is queued and a job id is returned (202) to
+    poll at /api/texty_jobs/<job_id>. Pass "wait": true to render in the
+    request instead.
+    """
     data = request.get_json()
-    if not data or "filename" not in data:
-        abort(400, description="Filename is required in the payload.")
-    
-    filename = data["filename"]
-    text_path = os.path.join(TEXTS_FOLDER, filename)
-    if not os.path.exists(text_path):
-        abort(404, description="File not found.")
-    
-    with open(text_path, "r") as f:
-        text_data = json.load(f)
-    
-    text_content = text_data.get("text", "")
-    labels = text_data.get("label", [])
-    labels = sorted(labels, key=lambda x: x[0])
-    
-    segments = []
-    last_idx = 0
-    for label in labels:
-        start, end, cat = label
-        if last_idx < start:
-            segments.append((text_content[last_idx:start], "#000000"))  # Un-categorized
-        color = categories_colors.get(cat, "#000000")
-        segments.append((text_content[start:end], color))
-        last_idx = end
-    if last_idx < len(text_content):
-        segments.append((text_content[last_idx:], "#000000"))
-    
-    words = segment_to_words(segments)
-    
-    # A4 dimensions (portrait)
-    A4_width = 800
-    A4_height = int(A4_width * 1.414)  # ~1131 pixels
-    
-    dummy_img = Image.new("RGB", (A4_width, A4_height))
-    dummy_draw = ImageDraw.Draw(dummy_img)
-    
-    # Use a TTF font (adjust font_path as needed)
-    font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-    
-    best_font_size = None
-    for size in range(10, 300):
-        candidate_font = ImageFont.truetype(font_path, size)
-        candidate_lines = wrap_words(dummy_draw, words, max_width=A4_width - 20, font=candidate_font)
-        candidate_line_bbox = dummy_draw.textbbox((0, 0), "A", font=candidate_font)
-        candidate_line_height = (candidate_line_bbox[3] - candidate_line_bbox[1]) + 5
-        candidate_total_height = len(candidate_lines) * candidate_line_height + 20
-        if candidate_total_height > A4_height - 20:
-            break
-        best_font_size = size
-    if best_font_size is None:
-        best_font_size = 10
-    font = ImageFont.truetype(font_path, best_font_size)
-    
-    # Create main PNG with white background
-    img = Image.new("RGB", (A4_width, A4_height), color="white")
-    draw = ImageDraw.Draw(img)
-    
-    lines = wrap_words(draw, words, max_width=A4_width - 20, font=font)
-    line_bbox = draw.textbbox((0, 0), "A", font=font)
-    line_height = (line_bbox[3] - line_bbox[1]) + 5
+    if data and "data_file" in data and "id" in data:
+        text_data = render_document(data["data_file"], data["id"])
+        filename = f"{os.path.splitext(data_file_name(data['data_file']))[0]}-{text_data['id']}.json"
+    elif not data or "filename" not in data:
+        abort(400, description="Filename (or data_file and id) is required in the payload.")
+    else:
+        filename = data["filename"]
+        text_path = os.path.join(TEXTS_FOLDER, filename)
+        if not os.path.exists(text_path):
+            abort(404, description="File not found.")
+        with open(text_path, "r") as f, texty_metrics.timed("load"):
+            text_data = json.load(f)
     
-    svg_elements = []
-    y_pos = 10
-    space_bbox = draw.textbbox((0, 0), " ", font=font)
-    space_width = space_bbox[2] - space_bbox[0]
+    refresh_config()
+    base_name = os.path.splitext(filename)[0]
+    key = render_key(text_data)
+    if data.get("wait"):
+        return jsonify(render_result(base_name, key, *cached_render(text_data, base_name, key)))
     
-    # Process each line: justify (if not last) or left-align (last)
-    for i, line in enumerate(lines):
-        if i < len(lines) - 1:
-            positions = justify_line_positions(draw, line, 10, y_pos, max_width=A4_width - 20, font=font)
-        else:
-            positions = []
-            cur_x = 10
-            for word, color in line:
-                bbox = draw.textbbox((0, 0), word, font=font)
-                w = bbox[2] - bbox[0]
-                positions.append({
-                    "x": cur_x,
-                    "y": y_pos,
-                    "word": word,
-                    "color": color,
-                    "width": w,
-                    "height": (draw.textbbox((0, 0), "A", font=font)[3] - draw.textbbox((0, 0), "A", font=font)[1])
-                })
-                cur_x += w + space_width
-        # Draw each word and record position info for SVG
-        for pos in positions:
-            x = pos["x"]
-            y = pos["y"]
-            word = pos["word"]
-            color = pos["color"]
-            w = pos["width"]
-            if color == "#000000":
-                # Un-categorized: draw invisible (white fill and stroke)
-                draw.text((x, y), word, fill="white", font=font, stroke_width=1, stroke_fill="white")
+    font_size, fresh = lookup_render(base_name, key)
+    if fresh:
+        result = render_result(base_name, key, font_size, True)
+        result.update({"job_id": f"{base_name}-{key[:16]}", "status": "done"})
+        return jsonify(result)
+    job = submit_render(text_data, filename, key, font_size)
+    return jsonify(job_status(job)), 202
+
+
+@app.route("/api/texty_gen_batch", methods=["POST"])
+def texty_gen_batch():
+    """
+    Generate the Texty images for many text files in one request. The payload
+    is {"filenames": [...]} or {"filenames": "all"}. Renders run in parallel
+    in the render pool and one NDJSON line is streamed back per file as it
+    finishes, followed by a summary line.
+    """
+    data = request.get_json()
+    if not data or "filenames" not in data:
+        abort(400, description="Filenames are required in the payload.")
+    filenames = data["filenames"]
+    if filenames == "all":
+        filenames = sorted(f for f in os.listdir(TEXTS_FOLDER) if f.endswith(".json"))
+    elif not isinstance(filenames, list) or not all(isinstance(filename, str) for filename in filenames):
+        abort(400, description="Filenames must be a list of strings or \"all\".")
+    filenames = list(dict.fromkeys(filenames))
+    refresh_config()
+
+    def generate():
+        summary = {"status": "finished", "total": len(filenames), "rendered": 0, "cached": 0, "failed": 0}
+
+        def line(filename, base_name, key, font_size, cached, error):
+            if error:
+                summary["failed"] += 1
+                result = {"filename": filename, "status": "failed", "error": error}
             else:
-                # Categorized: use padding_x=2, padding_y=5
-                padding_x = 2
-                padding_y = 5
-                bbox = draw.textbbox((x, y), word, font=font)
-                h = bbox[3] - bbox[1]
-                draw.rectangle([x - padding_x, y - padding_y, x + w + padding_x, y + h + padding_y], fill=color)
-                draw.text((x, y), word, fill=color, font=font, stroke_width=1, stroke_fill=color)
-            svg_elements.append(pos)
-        y_pos += line_height
-    
-    # Save main PNG image
-    png_filename = os.path.splitext(filename)[0] + ".png"
-    png_path = os.path.join(TEXTY_FOLDER, png_filename)
-    img.save(png_path, "PNG")
-    
-    # Create mini PNG (20% size) and save with suffix "-mini.png"
-    mini_width = int(A4_width * 0.2)
-    mini_height = int(A4_height * 0.2)
-    mini_img = img.resize((mini_width, mini_height), resample=Image.LANCZOS)
-    mini_png_filename = os.path.splitext(filename)[0] + "-mini.png"
-    mini_png_path = os.path.join(TEXTY_FOLDER, mini_png_filename)
-    mini_img.save(mini_png_path, "PNG")
-    
-    # Generate SVG output using computed positions
-    svg_header = f'<svg xmlns="http://www.w3.org/2000/svg" width="{A4_width}" height="{A4_height}">'
-    svg_header += '<rect width="100%" height="100%" fill="white" />'
-    svg_body = ""
-    for el in svg_elements:
-        x = el["x"]
-        y = el["y"]
-        word = el["word"]
-        w = el["width"]
-        h = el["height"]
-        color = el["color"]
-        text_y = y + h  # adjust for baseline
-        if color == "#000000":
-            svg_body += (
-                f'<text x="{x}" y="{text_y}" fill="white" stroke="white" stroke-width="1" '
-                f'font-size="{best_font_size}" font-family="DejaVu Sans">{word}</text>'
-            )
-        else:
-            padding_x = 2
-            padding_y = 5
-            svg_body += f'<rect x="{x - padding_x}" y="{y - padding_y}" width="{w + 2*padding_x}" height="{h + 2*padding_y}" fill="{color}" />'
-            svg_body += (
-                f'<text x="{x}" y="{text_y}" fill="{color}" stroke="{color}" stroke-width="1" '
-                f'font-size="{best_font_size}" font-family="DejaVu Sans">{word}</text>'
-            )
-    svg_footer = '</svg>'
-    svg_content = svg_header + svg_body + svg_footer
-    svg_filename = os.path.splitext(filename)[0] + ".svg"
-    svg_path = os.path.join(TEXTY_FOLDER, svg_filename)
+                summary["cached" if cached else "rendered"] += 1
+                result = render_result(base_name, key, font_size, cached)
+                result.update({"filename": filename, "status": "done"})
+            return json.dumps(result) + "\n"
+
+        pending = []
+        for filename in filenames:
+            base_name = os.path.splitext(filename)[0]
+            text_path = safe_join(TEXTS_FOLDER, filename)
+            if text_path is None:
+                yield line(filename, base_name, None, None, False, "File is outside the texts folder.")
+                continue
+            if not os.path.exists(text_path):
+                yield line(filename, base_name, None, None, False, "File not found.")
+                continue
+            try:
+                with open(text_path, "r") as f, texty_metrics.timed("load"):
+                    text_data = json.load(f)
+            except (OSError, ValueError) as e:
+                yield line(filename, base_name, None, None, False, f"Invalid text file: {e}")
+                continue
+            key = render_key(text_data)
+            font_size, fresh = lookup_render(base_name, key)
+            if fresh:
+                yield line(filename, base_name, key, font_size, True, None)
+            else:
+                pending.append((filename, (text_data, base_name, key, font_size)))
+
+        if pending:
+            # Spread the texts over the workers, in chunks that share measurements.
+            # Identical texts are kept next to each other so they land in the same chunk.
+            first = {}
+            for position, (_, item) in enumerate(pending):
+                first.setdefault(item[2], position)
+            pending.sort(key=lambda entry: first[entry[1][2]])
+            chunk_size = min(BATCH_CHUNK_SIZE, -(-len(pending) // RENDER_WORKERS))
+            names = {item[1]: filename for filename, item in pending}
+            keys_by_name = {item[1]: item[2] for _, item in pending}
+            keys = [item[2] for _, item in pending]
+            with jobs_lock:
+                pending_keys.update(keys)
+            futures = []
+            for i in range(0, len(pending), chunk_size):
+                chunk = [item for _, item in pending[i:i + chunk_size]]
+                futures.append((submit_to_pool(texty_metrics.call, render_batch, chunk), chunk))
+            future_chunks = dict(futures)
+            try:
+                for future in as_completed(future_chunks):
+                    chunk = future_chunks[future]
+                    try:
+                        results, timings = future.result()
+                        texty_metrics.merge(timings)
+                    except Exception as e:
+                        results = [(item[1], None, False, str(e)) for item in chunk]
+                    record_renders([(base_name, item[2], font_size)
+                                    for (base_name, font_size, _, error), item in zip(results, chunk) if not error])
+                    for base_name, font_size, cached, error in results:
+                        yield line(names[base_name], base_name, keys_by_name[base_name], font_size, cached, error)
+            finally:
+                with jobs_lock:
+                    release_keys(keys)
+
+        yield json.dumps(summary) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/texty_jobs/<job_id>", methods=["GET"])
+def texty_job(job_id):
+    """Status of a render job: queued, running, done (with the file names) or failed."""
+    with jobs_lock:
+        job = render_jobs.get(job_id)
+    if job is not None:
+        return jsonify(job_status(job))
+    # The job may have been run by another server process: check the manifest
+    base_name, _, key_prefix = job_id.rpartition("-")
+    with manifest_lock:
+        entry = load_manifest()["outputs"].get(base_name)
+    if entry and entry["key"].startswith(key_prefix):
+        result = render_result(base_name, entry["key"], entry["font_size"], True)
+        result.update({"job_id": job_id, "filename": base_name + ".json", "status": "done"})
+        return jsonify(result)
+    abort(404, description="Unknown job.")
+
+
+def text_words(text_data):
+    """Split the text into (word, color) tuples, colored by label category."""
+    return texty_layout.text_words(text_data, categories_colors)
+
+def render_texty(text_data, base_name):
+    """Render PNG, mini PNG and SVG for text_data into TEXTY_FOLDER. Returns the font size used."""
+    layout = texty_layout.layout_text(text_words(text_data))
+    write_layout(layout, os.path.join(TEXTY_FOLDER, base_name))
+    return layout["font_size"]
+
+def write_layout(layout, output_base):
+    """Write output_base + .png, -mini.png and .svg for a layout."""
+    save_png(texty_layout.draw_png(layout), output_base + ".png")
+    save_png(texty_layout.draw_mini(layout), output_base + "-mini.png")
+    svg_path = output_base + ".svg"
     with open(svg_path, "w") as f:
-        f.write(svg_content)
-    
+        texty_layout.write_svg(f, layout, categories_colors)
+    with texty_metrics.timed("precompress"):
+        write_precompressed(svg_path)
+
+def save_png(img, path):
+    """Save img as PNG using the PNG_PALETTE and PNG_COMPRESS_LEVEL settings."""
+    texty_layout.save_png(img, path, categories_colors.values(), PNG_PALETTE, PNG_COMPRESS_LEVEL)
+
+
+# -----------------------------
+# Paginated layout
+# -----------------------------
+def build_page_index(text_data):
+    """
+    Wrap the text once at PAGE_FONT_SIZE and split the lines into pages.
+    "paginated" is False when the text fits on one page, in which case it is
+    rendered as usual.
+    """
+    return texty_layout.build_page_index(text_words(text_data), PAGE_FONT_SIZE)
+
+def load_page_index(text_data, base_name, key):
+    """Return the page index of a text, building it once per cache key, and publish it to PAGES_FOLDER."""
+    path = os.path.join(CACHE_FOLDER, f"{key}-{PAGE_FONT_SIZE}pt-pages.json")
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            index = json.load(f)
+    else:
+        index = build_page_index(text_data)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, path)
+    with manifest_lock:
+        manifest = load_manifest()
+        if manifest.setdefault("pages", {}).get(base_name) != key:
+            manifest["pages"][base_name] = key
+            save_manifest(manifest)
+    link_file(path, os.path.join(PAGES_FOLDER, base_name + ".json"))
+    return index
+
+def render_page(text_data, index, page, output_base):
+    """Render page number page (1-based) of a paginated text. Only the words on that page are measured."""
+    write_layout(texty_layout.layout_page(text_words(text_data), index, page), output_base)
+
+
+def read_text_file(filename):
+    """Load a text from TEXTS_FOLDER, aborting with 404 if it does not exist or is outside the folder."""
+    text_path = safe_join(TEXTS_FOLDER, filename)
+    if text_path is None or not os.path.exists(text_path):
+        abort(404, description="File not found.")
+    with open(text_path, "r") as f, texty_metrics.timed("load"):
+        return json.load(f)
+
+
+@app.route("/api/texty_pages/<path:filename>", methods=["GET"])
+def texty_pages(filename):
+    """Page index of a text: whether it is paginated and how many pages it has."""
+    text_data = read_text_file(filename)
+    refresh_config()
+    base_name = os.path.splitext(filename)[0]
+    index = load_page_index(text_data, base_name, render_key(text_data))
     return jsonify({
-        "message": "Texty image generated successfully.",
-        "png_file": png_filename,
-        "mini_png_file": mini_png_filename,
-        "svg_file": svg_filename,
-        "font_size": best_font_size
+        "filename": filename,
+        "paginated": index["paginated"],
+        "page_count": index["page_count"],
+        "font_size": index["font_size"],
+        "index_file": "pages/" + base_name + ".json",
+    })
+
+
+@app.route("/api/texty_page/<path:filename>/<int:page>", methods=["GET"])
+def texty_page(filename, page):
+    """
+    Images of one page of a text, rendered the first time the page is asked
+    for. A text that fits on one page has a single page, its regular render.
+    """
+    text_data = read_text_file(filename)
+    refresh_config()
+    base_name = os.path.splitext(filename)[0]
+    key = render_key(text_data)
+    index = load_page_index(text_data, base_name, key)
+    if not 1 <= page <= index["page_count"]:
+        abort(404, description="Page not found.")
+    if not index["paginated"]:
+        result = render_result(base_name, key, *cached_render(text_data, base_name, key))
+        result.update({"page": 1, "page_count": 1})
+        return jsonify(result)
+
+    page_base = f"{base_name}-p{page}"
+    cache_base = f"{key}-{index['font_size']}pt-p{page}"
+    outputs = [os.path.join(PAGES_FOLDER, page_base + suffix) for suffix in OUTPUT_SUFFIXES]
+    cached = [os.path.join(CACHE_FOLDER, cache_base + suffix) for suffix in OUTPUT_SUFFIXES]
+    is_cached = all(os.path.exists(path) for path in cached)
+    if not is_cached:
+        with jobs_lock:
+            pending_keys[key] += 1
+        try:
+            for path in outputs:
+                if os.path.exists(path):
+                    os.remove(path)
+            render_page(text_data, index, page, os.path.join(PAGES_FOLDER, page_base))
+            for src, dst in zip(outputs, cached):
+                link_file(src, dst)
+        finally:
+            with jobs_lock:
+                release_keys([key])
+    else:
+        for src, dst in zip(cached, outputs):
+            link_file(src, dst)
+    return jsonify({
+        "message": "Texty page generated successfully.",
+        "page": page,
+        "page_count": index["page_count"],
+        "png_file": f"pages/{page_base}.png",
+        "mini_png_file": f"pages/{page_base}-mini.png",
+        "svg_file": f"pages/{page_base}.svg",
+        "png_url": f"/texty/cache/{cache_base}.png",
+        "mini_png_url": f"/texty/cache/{cache_base}-mini.png",
+        "svg_url": f"/texty/cache/{cache_base}.svg",
+        "font_size": index["font_size"],
+        "cached": is_cached
     })
 
 
+# -----------------------------
+# Documents read by id from the JSONL corpora
+# -----------------------------
+data_index = None
+data_index_lock = threading.Lock()
+
+def refresh_data_index():
+    """The byte-offset index of DATA_FOLDER, rescanning only the files that changed."""
+    global data_index
+    if not os.path.isdir(DATA_FOLDER):
+        abort(404, description="Data folder not found.")
+    with data_index_lock:
+        data_index, _ = record_index.refresh_index(DATA_FOLDER, data_index)
+        return data_index
+
+def data_file_name(name):
+    """Accept data file names with or without their .jsonl extension."""
+    return name if name.endswith(".jsonl") else name + ".jsonl"
+
+def read_document(name, doc_id):
+    """Read one document of a JSONL data file through the index, aborting with 404 if it does not exist."""
+    index = refresh_data_index()
+    name = data_file_name(name)
+    if name not in index["files"]:
+        abort(404, description="Data file not found.")
+    with data_index_lock, texty_metrics.timed("load"):
+        record = record_index.read_record(DATA_FOLDER, index, name, doc_id)
+    if record is None:
+        abort(404, description="Document not found.")
+    return record
+
+
+def render_document(name, doc_id):
+    """
+    Document doc_id of a JSONL data file as an {id, text, label} record, read
+    from the memory-mapped span store of the file (built on first use).
+    Aborts with 404 if the file or the document does not exist.
+    """
+    path = safe_join(DATA_FOLDER, data_file_name(name))
+    if path is None or not os.path.isfile(path):
+        abort(404, description="Data file not found.")
+    with texty_metrics.timed("load"):
+        store, _ = span_store.open_store(path)
+        position = store.position(doc_id)
+    if position is None:
+        abort(404, description="Document not found.")
+    return store.record(position)
+
+
+@app.route("/api/documents/<doc_id>", methods=["GET"])
+def document_files(doc_id):
+    """The data files that contain document doc_id."""
+    files = record_index.find_document(refresh_data_index(), doc_id)
+    if not files:
+        abort(404, description="Document not found.")
+    return jsonify({"id": doc_id, "files": files})
+
+
+@app.route("/api/documents/<data_file>/<doc_id>", methods=["GET"])
+def document(data_file, doc_id):
+    """
+    Document doc_id of a JSONL data file, read straight from the file. Render
+    it with POST /api/texty_gen {"data_file": ..., "id": ...}.
+    """
+    return jsonify(read_document(data_file, doc_id))
+
+
+# -----------------------------
+# Text and Texty catalogues
+# -----------------------------
+# Directories are re-listed when their mtime changes; text files are re-statted
+# at most every CATALOGUE_POLL_INTERVAL seconds to catch in-place edits, and
+# only files whose size or mtime changed are parsed again.
+CATALOGUE_POLL_INTERVAL = 2.0
+catalogue_lock = threading.Lock()
+text_catalogue = {"dir_mtime": None, "checked": 0.0, "files": {}, "texts": [], "etag": None}
+texty_catalogue = {"dir_mtime": None, "files": [], "etag": None}
+
+def catalogue_etag(parts):
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:32]
+
+def refresh_text_catalogue():
+    """Bring the parsed texts/*.json catalogue up to date and return it."""
+    with catalogue_lock:
+        cat = text_catalogue
+        dir_mtime = os.stat(TEXTS_FOLDER).st_mtime_ns
+        now = time.monotonic()
+        if dir_mtime == cat["dir_mtime"] and now - cat["checked"] < CATALOGUE_POLL_INTERVAL:
+            return cat
+        files = {}
+        for entry in os.scandir(TEXTS_FOLDER):
+            if not (entry.name.endswith(".json") and entry.is_file()):
+                continue
+            stat = entry.stat()
+            state = (stat.st_mtime_ns, stat.st_size)
+            old = cat["files"].get(entry.name)
+            if old and old[0] == state:
+                files[entry.name] = old
+                continue
+            try:
+                with open(entry.path, "r") as f, texty_metrics.timed("load"):
+                    text_data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[!] Skipping {entry.path}: {e}")
+                continue
+            text_data["filename"] = entry.name
+            files[entry.name] = (state, text_data)
+        cat["dir_mtime"], cat["checked"] = dir_mtime, now
+        if files.keys() != cat["files"].keys() or any(files[name][0] != cat["files"][name][0] for name in files):
+            cat["files"] = files
+            cat["texts"] = [files[name][1] for name in sorted(files)]
+            cat["etag"] = catalogue_etag([[name, files[name][0]] for name in sorted(files)])
+        return cat
+
+def refresh_texty_catalogue():
+    """Bring the listing of rendered files in TEXTY_FOLDER up to date and return it."""
+    with catalogue_lock:
+        cat = texty_catalogue
+        texty_dir = os.path.join(app.root_path, TEXTY_FOLDER)
+        if not os.path.isdir(texty_dir):
+            cat.update({"dir_mtime": None, "files": [], "etag": catalogue_etag([])})
+            return cat
+        dir_mtime = os.stat(texty_dir).st_mtime_ns
+        if dir_mtime != cat["dir_mtime"]:
+            cat["files"] = sorted(entry.name for entry in os.scandir(texty_dir)
+                                  if entry.is_file() and not entry.name.endswith((".gz", ".br")))
+            cat["etag"] = catalogue_etag(cat["files"])
+            cat["dir_mtime"] = dir_mtime
+        return cat
+
+def paginate(items, default_limit=None):
+    """Apply the offset and limit query arguments to items."""
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = request.args.get("limit", default_limit, type=int)
+    if limit is None or limit < 0:
+        return items[offset:]
+    return items[offset:offset + limit]
+
+def conditional_json(etag, build):
+    """
+    Answer 304 when the client already has this version (If-None-Match),
+    otherwise return build() as JSON tagged with the ETag. The ETag covers the
+    query string, so every page and variant is cached separately.
+    """
+    etag = catalogue_etag([etag, request.query_string.decode("latin-1")])
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
 @app.route("/api/show_texts", methods=["GET"])
 def show_texts():
-    texts = []
-    # List each .json file in the /texts folder
-    for filename in os.listdir(TEXTS_FOLDER):
-        if filename.endswith(".json"):
-            file_path = os.path.join(TEXTS_FOLDER, filename)
-            with open(file_path, "r") as f:
-                text_data = json.load(f)
-                # Optionally, include the filename in the returned data
-                text_data["filename"] = filename
-                texts.append(text_data)
-    return jsonify(texts)
+    """
+    All texts in the texts folder, sorted by filename. Supports offset/limit
+    pagination (the total is sent in X-Total-Count) and ?meta=1 to leave out
+    the text bodies.
+    """
+    cat = refresh_text_catalogue()
+    texts = cat["texts"]
+    meta = request.args.get("meta", "0") not in ("0", "", "false")
+
+    def build():
+        page = paginate(texts)
+        if meta:
+            page = [{k: v for k, v in text_data.items() if k != "text"} for text_data in page]
+        return page
+
+    response = conditional_json(cat["etag"], build)
+    response.headers["X-Total-Count"] = str(len(texts))
+    return response
+
+
+# -----------------------------
+# Search over texts and labelled spans
+# -----------------------------
+search_lock = threading.Lock()
+search_state = {"signature": None, "index": None, "etag": None}
 
+def refresh_search_index():
+    """The search index, loaded again when data_for_frontend.py has rewritten it."""
+    with search_lock:
+        try:
+            stat = os.stat(SEARCH_INDEX_PATH)
+        except OSError:
+            abort(404, description="Search index not found, run data_for_frontend.py first.")
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if signature != search_state["signature"]:
+            with texty_metrics.timed("load"):
+                search_state["index"] = span_search.load_search_index(SEARCH_INDEX_PATH)
+            search_state["signature"] = signature
+            search_state["etag"] = catalogue_etag(list(signature))
+        return search_state
+
+
+@app.route("/api/search", methods=["GET"])
+def search():
+    """
+    Postings of q in the search index. match=span (default) finds labelled
+    spans whose whole text is q, match=token the words of q in documents that
+    contain all of them. Filter with label, classifier and, for spans,
+    agreed=0/1 (whether all classifiers labelled the span alike). Paginated
+    with offset/limit (default SEARCH_PAGE_SIZE), the total is sent in
+    X-Total-Count.
+    """
+    query = request.args.get("q", "").strip()
+    match = request.args.get("match", "span")
+    if not query:
+        abort(400, description="A query (q) is required.")
+    if match not in ("span", "token"):
+        abort(400, description="match must be \"span\" or \"token\".")
+    agreed = request.args.get("agreed")
+    if agreed is not None:
+        agreed = 0 if agreed in ("0", "false") else 1
+    state = refresh_search_index()
+    index = state["index"]
+    hits = span_search.search(index, query, match, request.args.get("label"), request.args.get("classifier"), agreed)
+
+    def build():
+        return {
+            "query": query,
+            "match": match,
+            "total": len(hits),
+            "results": [span_search.posting(index, hit, match) for hit in paginate(hits, SEARCH_PAGE_SIZE)]
+        }
+
+    response = conditional_json(state["etag"], build)
+    response.headers["X-Total-Count"] = str(len(hits))
+    return response
+
+
+# -----------------------------
+# Thumbnail atlas
+# -----------------------------
+atlas_lock = threading.Lock()
+atlas_state = {"etag": None, "index": None, "sheets": {}}
+
+def build_atlas_sheet(names, texty_dir):
+    """Pack the given mini PNGs into one sheet. Returns the sheet image and the offsets of each name."""
+    images = []
+    for name in names:
+        with Image.open(os.path.join(texty_dir, name)) as img:
+            images.append(img.convert("RGB"))
+    tile_width = max(img.width for img in images)
+    tile_height = max(img.height for img in images)
+    columns = min(ATLAS_COLUMNS, len(images))
+    rows = -(-len(images) // columns)
+    sheet = Image.new("RGB", (columns * tile_width, rows * tile_height), color="white")
+    offsets = {}
+    for i, (name, img) in enumerate(zip(names, images)):
+        x, y = (i % columns) * tile_width, (i // columns) * tile_height
+        sheet.paste(img, (x, y))
+        offsets[name] = {"x": x, "y": y, "w": img.width, "h": img.height}
+    return texty_layout.to_palette(sheet), offsets
+
+def refresh_atlas():
+    """
+    Bring the sprite sheets up to date with the mini PNGs in the texty folder
+    and return the atlas state. A sheet is only rebuilt when the name, mtime
+    or size of one of its files changed (a re-rendered text keeps its name);
+    sheets are named after the hash of their content, and so is the ETag.
+    """
+    cat = refresh_texty_catalogue()
+    with atlas_lock:
+        texty_dir = os.path.join(app.root_path, TEXTY_FOLDER)
+        atlas_dir = os.path.join(app.root_path, ATLAS_FOLDER)
+        os.makedirs(atlas_dir, exist_ok=True)
+        minis = [name for name in cat["files"] if name.endswith("-mini.png")]
+        index = {"sheets": [], "images": {}}
+        sheets = {}
+        for start in range(0, len(minis), ATLAS_SHEET_SIZE):
+            names = minis[start:start + ATLAS_SHEET_SIZE]
+            stats = [os.stat(os.path.join(texty_dir, name)) for name in names]
+            signature = catalogue_etag([[name, st.st_mtime_ns, st.st_size] for name, st in zip(names, stats)])
+            sheet = atlas_state["sheets"].get(signature)
+            if sheet is None or not os.path.exists(os.path.join(texty_dir, sheet["file"])):
+                img, offsets = build_atlas_sheet(names, texty_dir)
+                buffer = io.BytesIO()
+                img.save(buffer, "PNG", optimize=True)
+                data = buffer.getvalue()
+                sheet_file = hashlib.sha256(data).hexdigest() + ".png"
+                with open(os.path.join(atlas_dir, sheet_file), "wb") as f:
+                    f.write(data)
+                sheet = {"file": "atlas/" + sheet_file, "width": img.width, "height": img.height, "offsets": offsets}
+            sheets[signature] = sheet
+            sheet_no = len(index["sheets"])
+            index["sheets"].append({key: sheet[key] for key in ["file", "width", "height"]})
+            for name, offset in sheet["offsets"].items():
+                index["images"][name] = dict(offset, sheet=sheet_no)
+        # Remove sheets that are no longer part of the atlas
+        current = {os.path.basename(sheet["file"]) for sheet in sheets.values()}
+        for name in os.listdir(atlas_dir):
+            if name.endswith(".png") and name not in current:
+                os.remove(os.path.join(atlas_dir, name))
+        etag = catalogue_etag([sheet["file"] for sheet in index["sheets"]])
+        atlas_state.update({"etag": etag, "index": index, "sheets": sheets})
+        return atlas_state
+
+
+@app.route('/api/texty_atlas', methods=['GET'])
+def texty_atlas():
+    """
+    Index of the thumbnail sprite sheets: {"sheets": [{file, width, height}],
+    "images": {name: {sheet, x, y, w, h}}}. Sheet files are served from
+    /texty/ and can be cached forever.
+    """
+    state = refresh_atlas()
+    return conditional_json(state["etag"], lambda: state["index"])
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Stage and request timings in the Prometheus text format (needs TEXTY_METRICS=1)."""
+    if not texty_metrics.enabled():
+        abort(404, description="Metrics are disabled, set TEXTY_METRICS=1 to enable them.")
+    return Response(texty_metrics.prometheus(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route('/api/textys', methods=['GET'])
 def list_textys():
-    # Define the path to the texty folder (adjust as needed)
-    texty_dir = os.path.join(app.root_path, 'texty')
-    
-    # If the folder doesn't exist, return an empty list
-    if not os.path.exists(texty_dir):
-        return jsonify([])
-    
-    # List all files in the folder (you can filter by extension if needed)
-    texty_files = [f for f in os.listdir(texty_dir) if os.path.isfile(os.path.join(texty_dir, f))]
-    
-    # Return the list of texty files
-    return jsonify(texty_files)
+    """Rendered files in the texty folder, with the same offset/limit pagination."""
+    cat = refresh_texty_catalogue()
+    response = conditional_json(cat["etag"], lambda: paginate(cat["files"]))
+    response.headers["X-Total-Count"] = str(len(cat["files"]))
+    return response
 
 
 if __name__ == "__main__":
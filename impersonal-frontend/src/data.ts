@@ -0,0 +1,100 @@
+// Data access for the frontend. data_for_frontend.py either writes the
+// monolithic frontend_data.json / span_data.json files, or (with --shard_size)
+// a small index.json plus gzip-compressed shards of documents. These helpers
+// read whichever is present, so components only fetch what they display.
+
+export interface DocumentEntry {
+  id: number;
+  title: string;
+  label_counts: { [classifier: string]: number };
+  shard: string;
+}
+
+export interface DocumentIndex {
+  base_files: string[];
+  stats: any[];
+  documents: DocumentEntry[];
+  [key: string]: any;
+}
+
+export interface DocumentData {
+  id: number;
+  text: string;
+  spans: any[];
+  stats_by_doc: any[];
+}
+
+let indexPromise: Promise<DocumentIndex> | null = null;
+let legacyPromise: Promise<{ frontend: any; spans: any[] | null }> | null = null;
+const shardPromises: { [shard: string]: Promise<any> } = {};
+
+// Fetch a JSON file, gunzipping it in the browser if it arrives compressed
+export async function fetchJson(url: string): Promise<any> {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Failed to fetch ${url}: ${response.statusText}`);
+  }
+  const buffer = await response.arrayBuffer();
+  const bytes = new Uint8Array(buffer);
+  if (bytes[0] === 0x1f && bytes[1] === 0x8b) {
+    const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('gzip'));
+    return new Response(stream).json();
+  }
+  return JSON.parse(new TextDecoder().decode(bytes));
+}
+
+async function loadLegacy(withSpans: boolean) {
+  if (!legacyPromise) {
+    legacyPromise = fetchJson('/frontend_data.json').then((frontend) => ({ frontend, spans: null }));
+  }
+  const legacy = await legacyPromise;
+  if (withSpans && legacy.spans === null) {
+    legacy.spans = (await fetchJson('/span_data.json'))['data'];
+  }
+  return legacy;
+}
+
+// The document index: sharded index.json when available, else built from frontend_data.json
+export function loadIndex(): Promise<DocumentIndex> {
+  if (!indexPromise) {
+    indexPromise = fetchJson('/index.json').catch(async () => {
+      const { frontend } = await loadLegacy(false);
+      const seen = new Set<number>();
+      const documents: DocumentEntry[] = [];
+      for (const text of frontend['texts']) {
+        if (seen.has(text.id)) {
+          continue;
+        }
+        seen.add(text.id);
+        documents.push({ id: text.id, title: text.text.slice(0, 80), label_counts: {}, shard: '' });
+      }
+      return { ...frontend, documents };
+    });
+  }
+  return indexPromise;
+}
+
+// Text, aligned spans and per-document stats for one document
+export async function loadDocument(id: number, withSpans = true): Promise<DocumentData> {
+  const index = await loadIndex();
+  const entry = index.documents.find((doc) => doc.id === id);
+  if (entry && entry.shard) {
+    if (!(entry.shard in shardPromises)) {
+      shardPromises[entry.shard] = fetchJson('/' + entry.shard);
+    }
+    const shard = await shardPromises[entry.shard];
+    return {
+      id,
+      text: shard['texts'].find((text: { id: number }) => text.id === id)?.text ?? '',
+      spans: shard['spans'].filter((row: { document_id: number }) => row.document_id === id),
+      stats_by_doc: shard['stats_by_doc'].filter((row: { document_id: number }) => row.document_id === id),
+    };
+  }
+  const { frontend, spans } = await loadLegacy(withSpans);
+  return {
+    id,
+    text: frontend['texts'].find((text: { id: number }) => text.id === id)?.text ?? '',
+    spans: (spans ?? []).filter((row: { document_id: number }) => row.document_id === id),
+    stats_by_doc: frontend['stats_by_doc'].filter((row: { document_id: number }) => row.document_id === id),
+  };
+}